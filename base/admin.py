@@ -4,7 +4,7 @@ from .models import (
     QuizTemplate, Lesson, MultipleChoiceQuestion, TracingQuestion,
     DmojExercise, ActivityCompletion, Language, CourseUnit, CourseTopic,
     CodeQuestion, CodeTestCase, CodeSubmission, CourseWeighting, StudentCourseEnrollment,
-    FillInTheBlankQuestion
+    FillInTheBlankQuestion, GradingJob, GradingResultCache, StudentActivitySummary
 )
 
 # --- Customized Admin Classes ---
@@ -58,7 +58,8 @@ class CodeQuestionAdmin(admin.ModelAdmin):
 
 @admin.register(CodeSubmission) # Register the CodeSubmission model
 class CodeSubmissionAdmin(admin.ModelAdmin):
-    list_display = ('id', 'activity_completion', 'created')
+    list_display = ('id', 'activity_completion', 'max_wall_time', 'total_cpu_time', 'peak_memory_kb', 'created')
+    ordering = ('-max_wall_time',)
 
 
 @admin.register(CodeTestCase)
@@ -109,6 +110,19 @@ class FillInTheBlankQuestionAdmin(admin.ModelAdmin):
     search_fields = ('topic__title', 'prompt', 'language')
 
 
+@admin.register(GradingJob)
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'activity', 'language', 'status', 'batch', 'created', 'started', 'finished')
+    search_fields = ('student__username',)
+    list_filter = ('status', 'language')
+
+
+@admin.register(GradingResultCache)
+class GradingResultCacheAdmin(admin.ModelAdmin):
+    list_display = ('id', 'question', 'hits', 'created')
+    search_fields = ('question__title', 'key')
+
+
 @admin.register(Language)
 class LanguageAdmin(admin.ModelAdmin):
     list_display = ("name",)
@@ -156,6 +170,13 @@ class QuizTemplateAdmin(admin.ModelAdmin):
     list_filter = ('question_type',)
 
 
+@admin.register(StudentActivitySummary)
+class StudentActivitySummaryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'activity', 'best_score', 'completed', 'attempt_count', 'last_activity')
+    search_fields = ('student__username',)
+    list_filter = ('completed',)
+
+
 @admin.register(StudentCourseEnrollment)
 class StudentCourseEnrollmentAdmin(admin.ModelAdmin):
     list_display = ('student', 'course', 'enrollment_date')
@@ -232,7 +232,7 @@ class CodeQuestionForm(forms.ModelForm):
     class Meta:
         model = CodeQuestion
         fields = [
-            "title", "prompt", "starter_code", "explanation", "question_type"
+            "title", "prompt", "starter_code", "explanation", "question_type", "time_limit", "memory_limit"
         ]
         widgets = {
             "title": forms.TextInput(attrs={"class": "input input-sm input-bordered text-sm block"}),
@@ -240,13 +240,15 @@ class CodeQuestionForm(forms.ModelForm):
             "starter_code": forms.Textarea(attrs={"class": "textarea textarea-xs textarea-bordered text-sm auto-resize", "rows": 1, "style": "overflow:hidden;", }),
             "explanation": forms.Textarea(attrs={"class": "textarea textarea-xs textarea-bordered text-sm auto-resize", "rows": 1, "style": "overflow:hidden;", }),
             "question_type": forms.Select(attrs={"class": "select select-sm select-bordered text-sm auto-resize block"}),
+            "time_limit": forms.NumberInput(attrs={"class": "input input-sm input-bordered text-sm block", "step": "any"}),
+            "memory_limit": forms.NumberInput(attrs={"class": "input input-sm input-bordered text-sm block"}),
         }
         
 
 class CodeTestCaseForm(forms.ModelForm):
     class Meta:
         model = CodeTestCase
-        fields = ["input_data", "expected_output", "order", "test_style"]
+        fields = ["input_data", "expected_output", "order", "test_style", "comparator", "tolerance", "time_limit", "memory_limit"]
         widgets = {
             "input_data": forms.Textarea(attrs={
                 "class": "textarea textarea-sm textarea-bordered w-full",
@@ -262,6 +264,20 @@ class CodeTestCaseForm(forms.ModelForm):
             "test_style": forms.Select(attrs={
                 "class": "select select-sm select-bordered w-full"
             }),
+            "comparator": forms.Select(attrs={
+                "class": "select select-sm select-bordered w-full"
+            }),
+            "tolerance": forms.NumberInput(attrs={
+                "class": "input input-sm input-bordered w-full",
+                "step": "any"
+            }),
+            "time_limit": forms.NumberInput(attrs={
+                "class": "input input-sm input-bordered w-full",
+                "step": "any"
+            }),
+            "memory_limit": forms.NumberInput(attrs={
+                "class": "input input-sm input-bordered w-full"
+            }),
         }
 
     def __init__(self, *args, **kwargs):
@@ -0,0 +1 @@
+# Grading infrastructure for code questions (runner containers, queues, caches)
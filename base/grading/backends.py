@@ -0,0 +1,155 @@
+import os
+import resource
+import signal
+import subprocess
+import sys
+from django.conf import settings
+from base.grading.docker_api import ContainerResult, parse_memory
+from base.grading.runner import run_docker, run_docker_archive, runner_output
+
+
+RUNNER_DIR = os.path.join(settings.BASE_DIR, "code_runner")
+
+# Bytes of files a local run may write (student code writing to disk, not its output)
+LOCAL_FILE_SIZE_LIMIT = 16 * 1024 * 1024
+
+
+# Grades a student directory against a test directory and returns the runner's JSON output
+# (timeout defaults to CODE_RUNNER_TIMEOUT). With batch=True the student directory holds one
+# subdirectory per submission and the output is {"batch": {subdirectory: output}}
+class RunnerBackend:
+    def run(self, student_path, tests_path, language, timeout=None, batch=False):
+        raise NotImplementedError
+
+    # Same, with student/ and tests/ sent as an archive from build_archive instead of directories
+    def run_archive(self, archive, language, timeout=None, batch=False):
+        raise NotImplementedError
+
+
+# Runs the code-runner images (warm pool or one container per submission)
+class DockerBackend(RunnerBackend):
+    def run(self, student_path, tests_path, language, timeout=None, batch=False):
+        return run_docker(student_path, tests_path, language, timeout, batch)
+
+    def run_archive(self, archive, language, timeout=None, batch=False):
+        return run_docker_archive(archive, language, timeout, batch)
+
+
+# Processes currently owned by this user; RLIMIT_NPROC counts them all, not just the run's own
+def user_process_count():
+    uid = os.getuid()
+    count = 0
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                if os.stat(os.path.join("/proc", entry)).st_uid == uid:
+                    count += 1
+            except OSError:
+                continue
+    return count
+
+
+# Runs the runners as plain subprocesses under rlimits, for hosts without Docker.
+# There is no filesystem or network isolation, so only use it where student code is trusted.
+class LocalBackend(RunnerBackend):
+    def command(self, language, memory):
+        if language == "java":
+            # The JVM reserves far more address space than it uses, so cap its heap instead of RLIMIT_AS
+            return [
+                "java", f"-Xmx{memory // (1024 * 1024)}m", "-Djava.security.manager=allow",
+                "-cp", settings.CODE_RUNNER_GSON_JAR, os.path.join(RUNNER_DIR, "java", "run.java"),
+            ]
+        return [sys.executable, os.path.join(RUNNER_DIR, "python", "run.py")]
+
+    def limits(self, language, memory, timeout):
+        limits = {
+            resource.RLIMIT_CPU: timeout,
+            resource.RLIMIT_FSIZE: LOCAL_FILE_SIZE_LIMIT,
+            resource.RLIMIT_NPROC: user_process_count() + settings.CODE_RUNNER_PIDS_LIMIT,
+            resource.RLIMIT_CORE: 0,
+        }
+        if language != "java":
+            limits[resource.RLIMIT_AS] = memory
+        return limits
+
+    # Sets the limits on the runner once it has started, rather than from preexec_fn, which isn't
+    # safe with threads (regrade runs this from a thread pool). The runner is still starting up
+    # then, so no student code runs without them, and every process it starts inherits them.
+    # A limit can only be lowered, never raised
+    def apply_limits(self, pid, limits):
+        for kind, value in limits.items():
+            _, hard = resource.prlimit(pid, kind)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.prlimit(pid, kind, (value, value))
+
+    def env(self, home, batch):
+        return {
+            "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+            "HOME": home,
+            "RUNNER_WORKERS": str(settings.CODE_RUNNER_TEST_WORKERS),
+            "RUNNER_OUTPUT_LIMIT": str(settings.CODE_RUNNER_OUTPUT_LIMIT),
+            "RUNNER_PROFILE": str(int(settings.CODE_RUNNER_PROFILE)),
+            "RUNNER_BATCH": str(int(batch)),
+            "RUNNER_SCRATCH": home,
+            "PYTHONDONTWRITEBYTECODE": "1",
+        }
+
+    def execute(self, args, workdir, env, language, timeout, stdin=None):
+        memory = parse_memory(settings.CODE_RUNNER_MEMORY)
+        process = subprocess.Popen(
+            self.command(language, memory) + args,
+            cwd=workdir,
+            env=env,
+            stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # Lets a timeout kill every process the run started
+        )
+        try:
+            self.apply_limits(process.pid, self.limits(language, memory, timeout))
+        except OSError:
+            # Never run without the limits (or leave the runner behind)
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.communicate()
+            raise
+        try:
+            stdout, stderr = process.communicate(input=stdin, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            raise
+        return runner_output(ContainerResult(process.returncode, False, stdout, stderr))
+
+    def run(self, student_path, tests_path, language, timeout=None, batch=False):
+        timeout = timeout or settings.CODE_RUNNER_TIMEOUT
+
+        # The runners expect student/ and tests/ next to each other in their working directory
+        workdir = os.path.dirname(os.path.abspath(student_path))
+        tests_link = os.path.join(workdir, "tests")
+        if not os.path.lexists(tests_link):
+            os.symlink(os.path.abspath(tests_path), tests_link)
+
+        return self.execute([], workdir, self.env(workdir, batch), language, timeout)
+
+    # The runner unpacks the archive into its own directory under GRADING_WORKSPACE_ROOT
+    # (a tmpfs by default) and removes it when done
+    def run_archive(self, archive, language, timeout=None, batch=False):
+        timeout = timeout or settings.CODE_RUNNER_TIMEOUT
+        root = os.path.abspath(settings.GRADING_WORKSPACE_ROOT)
+        os.makedirs(root, exist_ok=True)
+        return self.execute(["--archive"], root, self.env(root, batch), language, timeout, stdin=archive)
+
+
+RUNNER_BACKENDS = {
+    "docker": DockerBackend,
+    "local": LocalBackend,
+}
+
+
+# The backend selected by GRADING_BACKEND
+def get_backend():
+    return RUNNER_BACKENDS[settings.GRADING_BACKEND]()
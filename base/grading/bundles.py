@@ -0,0 +1,100 @@
+import json
+import math
+import os
+import re
+import shutil
+import stat
+import tempfile
+from django.conf import settings
+
+
+# Hidden tests grade submissions; the visible (sample) tests live in their own bundle for sample runs
+def bundle_path(question_id, version, sample=False):
+    name = f"v{version}-sample" if sample else f"v{version}"
+    return os.path.join(settings.TEST_BUNDLE_ROOT, str(question_id), name)
+
+
+BUNDLE_NAME = re.compile(r"^v(\d+)(-sample)?$")
+
+
+# Makes a bundle writable again so it can be deleted
+def _remove_bundle(path):
+    for root, dirs, files in os.walk(path):
+        os.chmod(root, stat.S_IRWXU)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_readonly(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, 0o444)
+
+
+# Writes the question's hidden (or sample) tests as a read-only bundle for its current test_version
+def build_test_bundle(question, sample=False):
+    question.refresh_from_db(fields=["test_version", "time_limit", "memory_limit"])
+    path = bundle_path(question.id, question.test_version, sample)
+    if os.path.isdir(path):
+        return path
+
+    question_dir = os.path.dirname(path)
+    os.makedirs(question_dir, exist_ok=True)
+
+    # Build next to the final location and rename, so graders never see a half-written bundle
+    temp_path = tempfile.mkdtemp(dir=question_dir, prefix=".building-")
+    manifest = {}
+    for i, case in enumerate(
+        question.test_cases.filter(is_hidden=not sample).order_by("order"), start=1
+    ):
+        _write_readonly(os.path.join(temp_path, f"{i}.in"), case.input_data)
+        _write_readonly(os.path.join(temp_path, f"{i}.out"), case.expected_output)
+        manifest[str(i)] = {
+            "comparator": case.comparator,
+            "tolerance": case.tolerance,
+            "time_limit": case.time_limit or question.time_limit,
+            "memory_limit": case.memory_limit or question.memory_limit,
+        }
+
+    # Per-test settings the grader applies to the runner's results
+    _write_readonly(os.path.join(temp_path, "manifest.json"), json.dumps({"tests": manifest}))
+    os.chmod(temp_path, 0o555)
+
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # Another process built the same version first
+        _remove_bundle(temp_path)
+
+    # Keep the newest older bundle for runs that are still using it. test_version goes up once per
+    # test case saved or deleted, so that is not necessarily test_version - 1
+    versions = {}
+    for name in os.listdir(question_dir):
+        match = BUNDLE_NAME.match(name)
+        if match and int(match.group(1)) < question.test_version:
+            versions.setdefault(bool(match.group(2)), []).append((int(match.group(1)), name))
+    for older in versions.values():
+        for _, name in sorted(older)[:-1]:
+            _remove_bundle(os.path.join(question_dir, name))
+
+    return path
+
+
+# Per-test settings (comparator, limits) written into a bundle by build_test_bundle
+def load_manifest(tests_path):
+    try:
+        with open(os.path.join(tests_path, "manifest.json")) as f:
+            return json.load(f).get("tests", {})
+    except (OSError, ValueError):
+        return {}
+
+
+# Timeout for a whole run: every test may use its full CPU limit (at up to 3x wall time) in turn
+def run_timeout(tests_path):
+    limits = [test.get("time_limit") or 0 for test in load_manifest(tests_path).values()]
+    return max(settings.CODE_RUNNER_TIMEOUT, math.ceil(sum(limit * 3 + 1 for limit in limits)))
+
+
+# Path and version of the bundle to grade against, building it if needed
+def get_test_bundle(question, sample=False):
+    path = build_test_bundle(question, sample)
+    return path, question.test_version
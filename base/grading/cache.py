@@ -0,0 +1,53 @@
+import hashlib
+import json
+from django.conf import settings
+from django.db.models import F
+from base.models import GradingResultCache
+
+
+# Line endings and trailing whitespace at the end of the file never change the result
+def normalize_source(code):
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+# Hash of the tests a submission is graded against
+def test_suite_hash(question):
+    cases = question.test_cases.filter(is_hidden=True).order_by("order").values_list(
+        "input_data", "expected_output", "test_style", "comparator", "tolerance", "time_limit", "memory_limit"
+    )
+    limits = [question.time_limit, question.memory_limit]
+    return hashlib.sha256(json.dumps([limits, list(cases)]).encode()).hexdigest()
+
+
+def result_cache_key(code, language, question):
+    parts = [normalize_source(code), language, test_suite_hash(question), settings.CODE_RUNNER_VERSION]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+# Timeouts depend on machine load, and a grader that died may not next time, so those are always regraded
+def is_cacheable(data):
+    if "summary" not in data or data.get("runner_failed"):
+        return False
+    return not any(
+        r.get("verdict") == "Timeout" or "Timeout" in (r.get("error") or "")
+        for r in data.get("results", [])
+    )
+
+
+# Returns the stored runner output for this key, or None
+def get_cached_result(key):
+    entry = GradingResultCache.objects.filter(key=key).only("id", "data").first()
+    if entry is None:
+        return None
+    GradingResultCache.objects.filter(id=entry.id).update(hits=F("hits") + 1)
+    return entry.data
+
+
+def store_result(key, question, data):
+    if is_cacheable(data):
+        GradingResultCache.objects.update_or_create(key=key, defaults={"question": question, "data": data})
+
+
+# Drops every cached result for a question (its test cases changed)
+def invalidate_question(question_id):
+    GradingResultCache.objects.filter(question_id=question_id).delete()
@@ -0,0 +1,92 @@
+import math
+import re
+from collections import Counter
+from itertools import zip_longest
+from base.grading.bundles import load_manifest
+
+
+TOKEN = re.compile(r"\S+")
+LINE = re.compile(r"[^\n]*\n|[^\n]+$")
+
+
+# Whitespace-separated tokens, produced one at a time
+def tokens(text):
+    return (match.group() for match in TOKEN.finditer(text))
+
+
+# Lines without trailing whitespace, ignoring blank lines at the end
+def lines(text):
+    return (match.group().rstrip() for match in LINE.finditer(text.rstrip()))
+
+
+def _same_float(expected, actual, tolerance):
+    try:
+        e, a = float(expected), float(actual)
+    except ValueError:
+        return expected == actual  # Non-numeric tokens still have to match exactly
+    if math.isnan(e) or math.isnan(a):
+        return math.isnan(e) and math.isnan(a)
+    return math.isclose(e, a, rel_tol=tolerance, abs_tol=tolerance)
+
+
+def compare_exact(expected, actual, tolerance):
+    return expected.strip() == actual.strip()
+
+
+def compare_tokens(expected, actual, tolerance):
+    return all(e == a for e, a in zip_longest(tokens(expected), tokens(actual)))
+
+
+def compare_lines(expected, actual, tolerance):
+    return all(e == a for e, a in zip_longest(lines(expected), lines(actual)))
+
+
+def compare_float(expected, actual, tolerance):
+    return all(
+        e is not None and a is not None and _same_float(e, a, tolerance)
+        for e, a in zip_longest(tokens(expected), tokens(actual))
+    )
+
+
+def compare_unordered(expected, actual, tolerance):
+    return Counter(lines(expected)) == Counter(lines(actual))
+
+
+# Keys match CodeTestCase.COMPARATOR_CHOICES
+COMPARATORS = {
+    "exact": compare_exact,
+    "tokens": compare_tokens,
+    "lines": compare_lines,
+    "float": compare_float,
+    "unordered": compare_unordered,
+}
+
+# Verdicts that stand whatever the output was
+UNCOMPARABLE_VERDICTS = {"Timeout", "Output Limit Exceeded", "Time Limit Exceeded", "Memory Limit Exceeded"}
+
+
+def outputs_match(expected, actual, comparator="exact", tolerance=0.0):
+    return COMPARATORS.get(comparator, compare_exact)(expected, actual, tolerance)
+
+
+# Re-judges the runner's results with each test's comparator. Runners compare exactly,
+# so only tests with another comparator change; this keeps one implementation for every language.
+def apply_comparators(data, tests_path):
+    manifest = load_manifest(tests_path)
+    results = data.get("results", [])
+
+    for r in results:
+        test = manifest.get(str(r.get("test")), {})
+        comparator = test.get("comparator", "exact")
+        if comparator == "exact" or r.get("verdict") in UNCOMPARABLE_VERDICTS:
+            continue
+
+        passed = outputs_match(r.get("expected", ""), r.get("actual", ""), comparator, test.get("tolerance", 0.0))
+        failed = r.get("verdict") == "Runtime Error" or r.get("exit_status") not in (0, None)
+        r["passed"] = passed
+        r["verdict"] = "Passed" if passed else ("Runtime Error" if failed else "Wrong Answer")
+
+    if "summary" in data:
+        passed = sum(1 for r in results if r.get("passed"))
+        data["summary"].update(passed=passed, all_passed=passed == len(results))
+    return data
@@ -0,0 +1,247 @@
+import http.client
+import io
+import json
+import queue
+import socket
+import struct
+import tarfile
+import time
+from collections import namedtuple
+from urllib.parse import quote, urlencode
+from django.conf import settings
+
+
+# "256m" / "1g" / "1048576" -> bytes (the format Docker uses for memory limits)
+def parse_memory(value):
+    value = str(value).strip().lower()
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+# How a container or exec finished; oom_killed is only known for whole containers
+ContainerResult = namedtuple("ContainerResult", ["exit_code", "oom_killed", "stdout", "stderr"])
+
+
+# HTTP over the Docker daemon's Unix socket
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+# Splits Docker's multiplexed stdout/stderr stream (8-byte frame headers) as it is read
+def demux(response):
+    streams = {1: io.BytesIO(), 2: io.BytesIO()}
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            break
+        kind, size = struct.unpack(">BxxxL", header)
+        data = response.read(size)
+        if kind in streams:
+            streams[kind].write(data)
+    return streams[1].getvalue(), streams[2].getvalue()
+
+
+# A tar archive of `directories` ({path: name inside the archive}), built in memory; with
+# `owner` every entry is owned by that uid (the daemon keeps the archive's ownership)
+def tar_directories(directories, owner=None):
+    def set_owner(info):
+        info.uid = info.gid = owner
+        info.uname = info.gname = ""
+        return info
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path, name in directories.items():
+            tar.add(path, arcname=name, filter=set_owner if owner is not None else None)
+    return buffer.getvalue()
+
+
+# Talks to the Engine API directly, keeping idle keep-alive connections for reuse
+# instead of forking the docker CLI for every call
+class DockerClient:
+    def __init__(self, socket_path=None, api_version=None):
+        self.socket_path = socket_path or settings.DOCKER_SOCKET
+        self.prefix = f"/v{api_version or settings.DOCKER_API_VERSION}"
+        self.idle = queue.LifoQueue()
+
+    def _connection(self, timeout):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = UnixHTTPConnection(self.socket_path, timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    # Sends a request and hands the open response to `read`; the connection goes back to the pool
+    # only once the response has been read in full
+    def request(self, method, path, params=None, body=None, headers=None, timeout=30, read=None):
+        url = self.prefix + path + ("?" + urlencode(params) if params else "")
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        conn = self._connection(timeout)
+        try:
+            conn.request(method, url, body=body, headers=headers)
+            response = conn.getresponse()
+            failed = response.status >= 400
+            result = read(response) if read and not failed else response.read()
+            response.read()  # Drain anything `read` left so the connection can be reused
+        except BaseException:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.idle.put(conn)
+
+        if failed:
+            try:
+                message = json.loads(result).get("message", "")
+            except ValueError:
+                message = result.decode(errors="replace")
+            raise DockerAPIError(response.status, message)
+        return result
+
+    # Sends a request the daemon answers by taking over the connection (attach, exec start),
+    # calls `ready()` once it has, writes `stdin` and closes it, then returns (stdout, stderr)
+    def hijack(self, path, body, stdin, timeout, ready=None):
+        body = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"POST {self.prefix}{path} HTTP/1.1\r\n"
+            "Host: localhost\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(head.encode() + body)
+            response = http.client.HTTPResponse(sock)
+            response.begin()
+            if response.status not in (101, 200):
+                raise DockerAPIError(response.status, response.read().decode(errors="replace"))
+            if ready:
+                ready()
+            sock.sendall(stdin)
+            sock.shutdown(socket.SHUT_WR)
+            return demux(response.fp)  # Past the headers the connection is a raw stream
+        finally:
+            sock.close()
+
+    def json(self, method, path, **kwargs):
+        payload = self.request(method, path, **kwargs)
+        return json.loads(payload) if payload else None
+
+    def create_container(self, config, name=None):
+        return self.json("POST", "/containers/create", params={"name": name} if name else None, body=config)["Id"]
+
+    def start(self, container):
+        self.request("POST", f"/containers/{quote(container)}/start")
+
+    # Blocks until the container exits; raises TimeoutError after `timeout` seconds
+    def wait(self, container, timeout):
+        return self.json("POST", f"/containers/{quote(container)}/wait", timeout=timeout)
+
+    def inspect(self, container):
+        return self.json("GET", f"/containers/{quote(container)}/json")
+
+    # (stdout, stderr) of a container, streamed and split as they are read
+    def logs(self, container):
+        return self.request(
+            "GET", f"/containers/{quote(container)}/logs", params={"stdout": 1, "stderr": 1}, read=demux
+        )
+
+    def remove(self, container):
+        self.request("DELETE", f"/containers/{quote(container)}", params={"force": 1, "v": 1})
+
+    # Unpacks a tar archive into a directory that already exists in the container
+    def put_archive(self, container, path, archive, timeout=30):
+        self.request(
+            "PUT", f"/containers/{quote(container)}/archive", params={"path": path}, body=archive,
+            headers={"Content-Type": "application/x-tar"}, timeout=timeout,
+        )
+
+    # Runs a command in a running container (with `stdin` as its input) and returns how it finished
+    def exec(self, container, cmd, env=None, workdir=None, timeout=30, stdin=None, user=None):
+        config = {"Cmd": cmd, "Env": env or [], "AttachStdout": True, "AttachStderr": True}
+        if workdir:
+            config["WorkingDir"] = workdir
+        if user:
+            config["User"] = user
+        if stdin is not None:
+            config["AttachStdin"] = True
+        exec_id = self.json("POST", f"/containers/{quote(container)}/exec", body=config)["Id"]
+        start = {"Detach": False, "Tty": False}
+        if stdin is not None:
+            stdout, stderr = self.hijack(f"/exec/{exec_id}/start", start, stdin, timeout)
+        else:
+            stdout, stderr = self.request(
+                "POST", f"/exec/{exec_id}/start", body=start, timeout=timeout, read=demux
+            )
+        exit_code = self.json("GET", f"/exec/{exec_id}/json")["ExitCode"]
+        return ContainerResult(exit_code, False, stdout, stderr)
+
+    # Creates and starts a container (attached to send it `stdin`), waits for it to exit and
+    # collects its output; the container is always removed, and TimeoutError is raised when it runs too long
+    def run(self, config, timeout, stdin=None):
+        deadline = time.monotonic() + timeout
+        container = self.create_container(config)
+        try:
+            if stdin is not None:
+                # Attach before starting so none of the output is missed
+                stdout, stderr = self.hijack(
+                    f"/containers/{quote(container)}/attach?stream=1&stdin=1&stdout=1&stderr=1",
+                    None, stdin, timeout, ready=lambda: self.start(container),
+                )
+                status = self.wait(container, max(1, deadline - time.monotonic()))
+            else:
+                self.start(container)
+                status = self.wait(container, timeout)
+                stdout, stderr = self.logs(container)
+            oom_killed = self.inspect(container)["State"].get("OOMKilled", False)
+            return ContainerResult(status.get("StatusCode"), oom_killed, stdout, stderr)
+        finally:
+            try:
+                self.remove(container)
+            except (DockerAPIError, OSError):
+                pass
+
+
+# Resource limits shared by every runner container
+def runner_host_config(**extra):
+    return {
+        "Memory": parse_memory(settings.CODE_RUNNER_MEMORY),
+        "NanoCpus": int(float(settings.CODE_RUNNER_CPUS) * 1e9),
+        "PidsLimit": settings.CODE_RUNNER_PIDS_LIMIT,
+        # Scratch space for archive mode; tmpfs pages count towards the memory limit
+        "Tmpfs": {"/scratch": f"rw,noexec,nosuid,size={settings.CODE_RUNNER_SCRATCH_SIZE}"},
+        **extra,
+    }
+
+
+docker = DockerClient()
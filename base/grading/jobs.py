@@ -0,0 +1,233 @@
+import json
+import os
+import subprocess
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from base.models import GradingJob, ActivityCompletion, CodeSubmission
+from base.utils import next_attempt_number, progress_change
+from base.grading.runner import write_student_files, build_archive
+from base.grading.backends import get_backend
+from base.grading.bundles import get_test_bundle, run_timeout
+from base.grading.compare import apply_comparators
+from base.grading.workspace import submission_workspace
+from base.grading.cache import result_cache_key, get_cached_result, store_result
+
+
+# Queues a submission for the grading workers
+def enqueue_submission(student, activity, question, code):
+    return GradingJob.objects.create(
+        student=student,
+        activity=activity,
+        question=question,
+        language=activity.course_topic.course.language.name.lower(),
+        code=code,
+    )
+
+
+# Queues a "Run Sample Tests" run. A student has at most one queued: it just takes the latest code,
+# while code sent once a run has started is queued to run after it
+def enqueue_sample_run(student, activity, question, code):
+    language = activity.course_topic.course.language.name.lower()
+    queued = GradingJob.objects.filter(student=student, sample=True, status="queued").first()
+    # A worker may claim it in the meantime, in which case a new run is queued as well
+    if queued and GradingJob.objects.filter(id=queued.id, status="queued").update(
+        activity=activity, question=question, language=language, code=code
+    ):
+        return queued
+
+    # Results of earlier runs the student is no longer waiting for
+    GradingJob.objects.filter(student=student, sample=True, status__in=["done", "failed"]).delete()
+    return GradingJob.objects.create(
+        student=student, activity=activity, question=question, language=language, code=code, sample=True
+    )
+
+
+# Puts jobs left running by a crashed worker back on the queue
+def requeue_stale_jobs():
+    cutoff = timezone.now() - timedelta(seconds=settings.GRADING_JOB_STALE_SECONDS)
+    return GradingJob.objects.filter(status="running", started__lt=cutoff).update(status="queued", started=None, batch="")
+
+
+# Hands code to the grading backend: written into `workspace`, or streamed as an archive when
+# there is none (see submission_workspace). `codes` maps a batch subdirectory of student/
+# ("" for a single submission) to its code
+def run_submissions(codes, tests_path, language, workspace, timeout, batch=False):
+    backend = get_backend()
+    if workspace is None:
+        return backend.run_archive(build_archive(codes, tests_path, language), language, timeout, batch)
+
+    student_path = os.path.join(workspace, "student")
+    for subdir, code in codes.items():
+        write_student_files(code, os.path.join(student_path, subdir), language)
+    return backend.run(student_path, tests_path, language, timeout, batch)
+
+
+# Runs the code against the question's tests and returns the runner's JSON output
+# together with the test_version it was graded against
+def grade_code(code, question, language, workspace):
+    tests_path, test_version = get_test_bundle(question)
+
+    # Identical code graded against an identical test suite gets the stored result
+    cache_key = None
+    if settings.GRADING_RESULT_CACHE:
+        cache_key = result_cache_key(code, language, question)
+        data = get_cached_result(cache_key)
+        if data is not None:
+            return data, test_version
+
+    output = run_submissions({"": code}, tests_path, language, workspace, run_timeout(tests_path))
+    data = apply_comparators(json.loads(output), tests_path)
+
+    if cache_key:
+        store_result(cache_key, question, data)
+    return data, test_version
+
+
+# Grades several jobs for one question and language in a single runner invocation against one
+# test bundle; returns {job id: runner output} and the test_version they were graded against
+def grade_batch(jobs, workspace):
+    question, language = jobs[0].question, jobs[0].language
+    tests_path, test_version = get_test_bundle(question)
+
+    graded, cache_keys = {}, {}
+    for job in jobs:
+        if settings.GRADING_RESULT_CACHE:
+            cache_keys[job.id] = result_cache_key(job.code, language, question)
+            data = get_cached_result(cache_keys[job.id])
+            if data is not None:
+                graded[job.id] = data
+
+    pending = [job for job in jobs if job.id not in graded]
+    if pending:
+        # The runner grades the submissions one after another, each with a single run's time
+        timeout = run_timeout(tests_path) * len(pending)
+        codes = {str(job.id): job.code for job in pending}
+        output = json.loads(run_submissions(codes, tests_path, language, workspace, timeout, batch=True))
+        for job in pending:
+            data = apply_comparators(output["batch"][str(job.id)], tests_path)
+            if job.id in cache_keys:
+                store_result(cache_keys[job.id], question, data)
+            graded[job.id] = data
+
+    return graded, test_version
+
+
+# Slowest test, total CPU time and largest peak memory over the runner's per-test usage
+def resource_totals(results):
+    def values(key):
+        return [r[key] for r in results if r.get(key) is not None]
+
+    wall_times, cpu_times, memory = values("wall_time"), values("cpu_time"), values("peak_memory_kb")
+    return {
+        "max_wall_time": max(wall_times, default=None),
+        "total_cpu_time": round(sum(cpu_times), 4) if cpu_times else None,
+        "peak_memory_kb": max(memory, default=None),
+    }
+
+
+# Runs the code against the question's visible tests only, with a short timeout; nothing is saved
+def run_sample_tests(code, question, language):
+    tests_path, _ = get_test_bundle(question, sample=True)
+    with submission_workspace() as workspace:
+        output = run_submissions({"": code}, tests_path, language, workspace, settings.SAMPLE_RUN_TIMEOUT)
+    return apply_comparators(json.loads(output), tests_path)
+
+
+# Activity score for a set of test results: the activity's weight scaled by the share of tests passed
+def score_results(activity, results):
+    total_tests = len(results)
+    passed_tests = sum(1 for r in results if r.get("passed"))
+    return activity.weight * (passed_tests / total_tests) if total_tests > 0 else 0
+
+
+# The summary stored with a submission; errors for the whole run (e.g. compilation) are kept with it
+def submission_summary(data):
+    summary = data.get("summary", {})
+    if data.get("error"):
+        summary = {**summary, "error": data["error"]}
+    return summary
+
+
+# Saves a graded attempt and updates the student's course progress
+def record_submission(student, activity, code, data, test_version=None):
+    results = data.get("results", [])
+    summary = submission_summary(data)
+    passed = summary.get("all_passed", False)
+
+    # 🔒 A completion may have been recorded while this job was queued
+    if not activity.allow_resubmission:
+        ac = ActivityCompletion.objects.filter(student=student, activity=activity, completed=True).first()
+        if ac:
+            return ac
+
+    # Calculate score
+    score = score_results(activity, results)
+
+    # ✅ Course-level progress and score are updated as the block exits
+    with progress_change(student, activity.course_topic.course, [activity]):
+        # ✅ Create a new ActivityCompletion
+        ac = ActivityCompletion.objects.create(
+            student=student,
+            activity=activity,
+            completed=passed,
+            score=score,
+            date_completed=timezone.now(),
+            attempt_number=next_attempt_number(student, activity)
+        )
+
+        # ✅ Save the submission
+        CodeSubmission.objects.create(
+            activity_completion=ac,
+            code=code,
+            results=results,
+            summary=summary,
+            test_version=test_version,
+            profile=data.get("profile"),
+            **resource_totals(results),
+        )
+
+    return ac
+
+
+# Grades a claimed job (unless `graded` already holds its runner output and test_version)
+# and stores the outcome on it; a sample run's output is kept on the job instead of recorded
+def run_job(job, graded=None):
+    try:
+        if job.sample:
+            job.result = run_sample_tests(job.code, job.question, job.language)
+        else:
+            # The workspace only lives until the result has been saved
+            with submission_workspace() as workspace:
+                data, test_version = graded or grade_code(job.code, job.question, job.language, workspace)
+                job.activity_completion = record_submission(job.student, job.activity, job.code, data, test_version)
+        job.status = "done"
+    except subprocess.TimeoutExpired:
+        job.status = "failed"
+        job.error = "Code execution timed out"
+    except json.JSONDecodeError:
+        job.status = "failed"
+        job.error = "Failed to parse grading output"
+    except Exception as e:
+        # Never leave a job stuck in "running" because of an unexpected error
+        job.status = "failed"
+        job.error = f"Grading error: {e}"
+
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "error", "activity_completion", "result", "finished"])
+    return job
+
+
+# Grades jobs claimed together by claim_batch in one runner invocation
+def run_batch(jobs):
+    graded, test_version = {}, None
+    if len(jobs) > 1:
+        try:
+            with submission_workspace() as workspace:
+                graded, test_version = grade_batch(jobs, workspace)
+        except Exception as e:
+            # Don't fail every job in the batch: they're graded one at a time below instead
+            print("[Batch grading failed]", e)
+            graded = {}
+
+    return [run_job(job, (graded[job.id], test_version) if job.id in graded else None) for job in jobs]
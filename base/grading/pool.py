@@ -0,0 +1,230 @@
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from django.conf import settings
+from base.grading.docker_api import DockerAPIError, docker, parse_memory, runner_host_config, tar_directories
+
+
+# Command used to grade a job inside a runner container (working directory /app)
+RUNNER_COMMANDS = {
+    "python": ["python", "run.py"],
+    "java": ["java", "-XX:SharedArchiveFile=/app/run.jsa", "-Djava.security.manager=allow", "-cp", "/app:/app/gson.jar", "Run"],
+}
+
+# Unprivileged user (created in the runner images) that runs the grader and student code in a pool container
+RUNNER_UID = 10001
+RUNNER_USER = f"{RUNNER_UID}:{RUNNER_UID}"
+
+# The only writable paths in a pool container; /app/tests is written by root and read-only to the runner
+RUNNER_MOUNTS = {"/app/student": 0o1777, "/app/tests": 0o755, "/app/classes": 0o1777, "/tmp": 0o1777}
+
+# Kills everything a job left running and empties the writable paths so the next job starts clean (run as root)
+SCRUB_COMMAND = "kill -9 -1 2>/dev/null; find /app/student /app/tests /app/classes /tmp /scratch -mindepth 1 -delete"
+
+# Seconds before retrying a container that failed to start, doubling up to the maximum
+SPAWN_RETRY_DELAY = 1
+SPAWN_RETRY_MAX_DELAY = 60
+
+
+# Raised by ContainerPool.run when no warm container came up in time; the caller grades on a cold one
+class PoolUnavailable(Exception):
+    pass
+
+
+# Environment for a grading run inside a runner container
+def runner_env(batch=False):
+    return [
+        f"RUNNER_WORKERS={settings.CODE_RUNNER_TEST_WORKERS}",
+        f"RUNNER_OUTPUT_LIMIT={settings.CODE_RUNNER_OUTPUT_LIMIT}",
+        f"RUNNER_PROFILE={int(settings.CODE_RUNNER_PROFILE)}",
+        f"RUNNER_BATCH={int(batch)}",
+        "RUNNER_SCRATCH=/scratch",  # tmpfs for archive mode
+        "RUNNER_CONTAINER=1",  # Lets the Java runner find daemons a batched submission detached
+    ]
+
+
+class RunnerContainer:
+    def __init__(self, language):
+        self.language = language
+        self.image = f"code-runner-{language}"
+        self.name = f"code-runner-{language}-{uuid.uuid4().hex[:12]}"
+        self.uses = 0
+        self.clean = True
+
+    # Starts an idle, resource-limited container that waits for jobs. Its root filesystem is
+    # read-only and jobs run as RUNNER_USER, so no job can change the grader for the next one
+    def start(self):
+        os.makedirs(settings.TEST_BUNDLE_ROOT, exist_ok=True)
+        size = parse_memory(settings.CODE_RUNNER_SCRATCH_SIZE)
+        config = {
+            "Image": self.image,
+            "Entrypoint": ["sleep"],
+            "Cmd": ["infinity"],
+            "User": RUNNER_USER,
+            "Labels": {"cody_crush.runner-pool": "1"},
+            "HostConfig": runner_host_config(
+                NetworkMode="none",
+                AutoRemove=True,
+                ReadonlyRootfs=True,
+                Binds=[os.path.abspath(settings.TEST_BUNDLE_ROOT) + ":/bundles:ro"],
+                # Mounts (unlike Tmpfs) accept archives from put_archive on a read-only root
+                Mounts=[
+                    {"Type": "tmpfs", "Target": target, "TmpfsOptions": {"SizeBytes": size, "Mode": mode}}
+                    for target, mode in RUNNER_MOUNTS.items()
+                ],
+            ),
+        }
+        docker.create_container(config, name=self.name)
+        try:
+            docker.start(self.name)
+        except (DockerAPIError, OSError):
+            self.stop()  # Auto-removal only applies once a container has started
+            raise
+
+    # Copies the job into the container, grades it and scrubs the container afterwards
+    def run_job(self, student_path, tests_path, timeout, batch=False):
+        self.uses += 1
+        # Owned by the runner, which removes batched submissions as it reads them in
+        docker.put_archive(
+            self.name, "/app/student", tar_directories({os.path.abspath(student_path): "."}, owner=RUNNER_UID),
+            timeout=timeout,
+        )
+
+        # Test bundles are already mounted read-only at /bundles, so they are copied from there
+        bundle_root = os.path.abspath(settings.TEST_BUNDLE_ROOT)
+        tests_path = os.path.abspath(tests_path)
+        if os.path.commonpath([bundle_root, tests_path]) == bundle_root:
+            bundle = f"/bundles/{os.path.relpath(tests_path, bundle_root)}"
+            copied = docker.exec(self.name, ["cp", "-R", f"{bundle}/.", "/app/tests/"], user="root", timeout=timeout)
+            if copied.exit_code != 0:
+                self.clean = False
+                raise OSError(f"Failed to copy tests into {self.name}: {copied.stderr.decode(errors='replace')}")
+        else:
+            docker.put_archive(self.name, "/app/tests", tar_directories({tests_path: "."}, owner=0), timeout=timeout)
+
+        return self._run_runner(RUNNER_COMMANDS[self.language], timeout, batch)
+
+    # Grades a job sent as an archive on the runner's stdin, which the runner unpacks into /scratch
+    def run_archive(self, archive, timeout, batch=False):
+        self.uses += 1
+        return self._run_runner(RUNNER_COMMANDS[self.language] + ["--archive"], timeout, batch, archive)
+
+    def _run_runner(self, command, timeout, batch, stdin=None):
+        try:
+            result = docker.exec(
+                self.name, command, env=runner_env(batch) + ["HOME=/tmp"], workdir="/app", timeout=timeout,
+                stdin=stdin, user=RUNNER_USER,
+            )
+        except TimeoutError:
+            raise subprocess.TimeoutExpired(command, timeout)
+        self.scrub()
+        return result
+
+    # A container that can't be scrubbed is retired rather than reused
+    def scrub(self):
+        try:
+            result = docker.exec(self.name, ["sh", "-c", SCRUB_COMMAND], user="root")
+            self.clean = result.exit_code == 0
+        except (DockerAPIError, OSError):
+            self.clean = False
+
+    def stop(self):
+        try:
+            docker.remove(self.name)
+        except (DockerAPIError, OSError):
+            pass
+
+
+class ContainerPool:
+    def __init__(self):
+        self.idle = {}
+        self.containers = set()
+        self.lock = threading.Lock()
+
+    def _queue(self, language):
+        with self.lock:
+            if language not in self.idle:
+                self.idle[language] = queue.Queue()
+                for _ in range(settings.CODE_RUNNER_POOL_SIZE.get(language, 0)):
+                    self._spawn(language)
+            return self.idle[language]
+
+    # Starts a replacement container in the background so callers never wait on it, retrying
+    # with backoff while Docker can't start one (e.g. the daemon is restarting)
+    def _spawn(self, language):
+        def start():
+            delay = SPAWN_RETRY_DELAY
+            while True:
+                container = RunnerContainer(language)
+                try:
+                    container.start()
+                    break
+                except (DockerAPIError, OSError) as e:
+                    print(f"[Runner Pool] Failed to start {container.name}, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, SPAWN_RETRY_MAX_DELAY)
+            with self.lock:
+                self.containers.add(container)
+            self.idle[language].put(container)
+
+        threading.Thread(target=start, daemon=True).start()
+
+    # An idle container, waited for while the pool has live ones to hand back; raises PoolUnavailable
+    # once `timeout` passes, or straight away when none have started
+    def _get(self, language, timeout):
+        idle = self._queue(language)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return idle.get(timeout=min(1, max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            with self.lock:
+                live = any(container.language == language for container in self.containers)
+            if not live or time.monotonic() >= deadline:
+                raise PoolUnavailable(language)
+
+    def _retire(self, container):
+        with self.lock:
+            self.containers.discard(container)
+        threading.Thread(target=container.stop, daemon=True).start()
+        self._spawn(container.language)
+
+    # Calls grade(container) on a warm container, recycling it after too many uses or any failure;
+    # returns the runner's ContainerResult
+    def run(self, language, timeout, grade):
+        container = self._get(language, timeout)
+        idle = self.idle[language]
+
+        try:
+            result = grade(container)
+        except (subprocess.SubprocessError, OSError, DockerAPIError):
+            # A timed out or broken container may still be running student code
+            self._retire(container)
+            raise
+
+        if not container.clean or container.uses >= settings.CODE_RUNNER_POOL_MAX_USES:
+            self._retire(container)
+        else:
+            idle.put(container)
+        return result
+
+    def shutdown(self):
+        with self.lock:
+            containers = list(self.containers)
+            self.containers.clear()
+        for container in containers:
+            container.stop()
+
+
+# Whether a warm pool is configured for this language
+def pool_enabled(language):
+    return settings.CODE_RUNNER_POOL_SIZE.get(language, 0) > 0
+
+
+runner_pool = ContainerPool()
+atexit.register(runner_pool.shutdown)
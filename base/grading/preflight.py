@@ -0,0 +1,109 @@
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import traceback
+from django.conf import settings
+from django.core.cache import cache
+from base.grading.runner import write_student_files
+from base.grading.workspace import grading_workspace
+
+
+JAVAC_TIMEOUT = 5  # Runs inside the web request, so a slow compile is left to the runner
+JAVAC_CACHE_SECONDS = 24 * 60 * 60
+JAVA_RELEASE = 17  # The Java runner image's JDK; any other javac could disagree with it
+PYTHON_RUNNER_VERSION = (3, 11)  # The Python runner image's interpreter (python:3.11-slim)
+
+
+# Python the runner grades with: this interpreter for the local backend, the runner image's otherwise
+def runner_python_version():
+    return sys.version_info[:2] if settings.GRADING_BACKEND == "local" else PYTHON_RUNNER_VERSION
+
+
+# Compiles Python source in-process (skipped unless this interpreter is the runner's version, since
+# syntax differs between versions); returns the error the runner would have shown, or None
+def check_python(code):
+    if sys.version_info[:2] != runner_python_version():
+        return None
+    try:
+        compile(code, "solution.py", "exec")
+    except (SyntaxError, ValueError) as e:
+        return "".join(traceback.format_exception_only(type(e), e)).strip()
+    except (RecursionError, MemoryError):
+        return None  # Too deeply nested or too big to check here; let the runner decide
+    return None
+
+
+# Major version of a javac ("javac 17.0.9" -> 17), or None if it can't be determined
+@functools.lru_cache(maxsize=None)
+def javac_version(javac):
+    try:
+        result = subprocess.run(
+            [javac, "-version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=JAVAC_TIMEOUT
+        )
+        version = result.stdout.decode(errors="replace").split()[1]
+        return int(version.split(".")[0])
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return None
+
+
+# Compiles Java source with the host's javac (skipped without one matching the runner's JDK);
+# results are cached per source
+def check_java(code):
+    javac = shutil.which("javac")
+    if javac is None or javac_version(javac) != JAVA_RELEASE:
+        return None
+
+    key = "javac-preflight:" + hashlib.sha256(code.encode()).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+
+    with grading_workspace() as workspace:
+        student_path = os.path.join(workspace, "student")
+        write_student_files(code, student_path, "java")
+        sources = [os.path.join(student_path, name) for name in os.listdir(student_path)]
+        try:
+            result = subprocess.run(
+                [javac, "--release", str(JAVA_RELEASE), "-proc:none", "-d", os.path.join(workspace, "classes"), *sources],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=JAVAC_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return None  # Let the runner decide
+        # Paths into the throwaway workspace mean nothing to the student
+        error = result.stdout.decode(errors="replace").replace(student_path + os.sep, "").strip()
+        error = (error or "Compilation failed") if result.returncode else ""
+
+    cache.set(key, error, JAVAC_CACHE_SECONDS)
+    return error or None
+
+
+PREFLIGHT_CHECKS = {
+    "python": check_python,
+    "java": check_java,
+}
+
+
+# Compile error for code that can't possibly pass, or None when it should be graded normally
+def preflight(code, language):
+    if not settings.GRADING_PREFLIGHT or language not in PREFLIGHT_CHECKS:
+        return None
+    return PREFLIGHT_CHECKS[language](code)
+
+
+# Runner-shaped output for a submission that failed pre-flight: every hidden test fails to compile
+def compile_error_result(question, error):
+    total = question.test_cases.filter(is_hidden=True).count()
+    results = [
+        {"test": str(i), "passed": False, "verdict": "Compile Error", "expected": "", "actual": "", "error": error}
+        for i in range(1, total + 1)
+    ]
+    return {
+        "results": results,
+        "summary": {"passed": 0, "total": total, "all_passed": False},
+        "error": error,
+    }
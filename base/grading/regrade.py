@@ -0,0 +1,125 @@
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from base.models import CodeQuestion, CodeSubmission, ActivityCompletion, StudentCourseEnrollment
+from base.utils import rebuild_activity_summaries, update_student_progress
+from base.grading.jobs import grade_code, score_results, resource_totals, submission_summary
+from base.grading.workspace import submission_workspace
+
+
+# Code submissions for a question, an activity or a whole course
+def submissions_to_regrade(question=None, activity=None, course=None):
+    submissions = CodeSubmission.objects.filter(
+        activity_completion__activity__content_type=ContentType.objects.get_for_model(CodeQuestion)
+    )
+    if question is not None:
+        submissions = submissions.filter(activity_completion__activity__object_id=question.id)
+    if activity is not None:
+        submissions = submissions.filter(activity_completion__activity=activity)
+    if course is not None:
+        submissions = submissions.filter(activity_completion__activity__course_topic__course=course)
+
+    return submissions.select_related(
+        "activity_completion__student",
+        "activity_completion__activity__course_topic__course__language",
+    ).order_by("id")
+
+
+# Grades one stored submission again; returns (submission, data) or (submission, error message)
+def _regrade_one(submission, question):
+    activity = submission.activity_completion.activity
+    language = activity.course_topic.course.language.name.lower()
+    try:
+        with submission_workspace() as workspace:
+            data, test_version = grade_code(submission.code, question, language, workspace)
+        data["test_version"] = test_version
+        return submission, data
+    except subprocess.TimeoutExpired:
+        return submission, "Code execution timed out"
+    except json.JSONDecodeError:
+        return submission, "Failed to parse grading output"
+    except Exception as e:
+        return submission, f"Grading error: {e}"
+    finally:
+        # Worker threads each get their own database connection
+        connection.close()
+
+
+# Writes a batch of regraded results and scores
+def _save_batch(graded):
+    submissions, completions = [], []
+    for submission, data in graded:
+        results = data.get("results", [])
+        submission.results = results
+        submission.summary = submission_summary(data)
+        submission.test_version = data.get("test_version")
+        submission.profile = data.get("profile")
+        for field, value in resource_totals(results).items():
+            setattr(submission, field, value)
+        submissions.append(submission)
+
+        ac = submission.activity_completion
+        ac.score = score_results(ac.activity, results)
+        ac.completed = submission.summary.get("all_passed", False)
+        completions.append(ac)
+
+    with transaction.atomic():
+        CodeSubmission.objects.bulk_update(
+            submissions,
+            ["results", "summary", "test_version", "profile", "max_wall_time", "total_cpu_time", "peak_memory_kb"]
+        )
+        ActivityCompletion.objects.bulk_update(completions, ["score", "completed"])
+
+        # bulk_update() sends no signals, so the activity summaries are rebuilt here
+        attempted = {}
+        for ac in completions:
+            attempted.setdefault(ac.student_id, set()).add(ac.activity_id)
+        for student_id, activity_ids in attempted.items():
+            rebuild_activity_summaries(student_id, list(activity_ids))
+
+
+# Regrades submissions in parallel and recomputes progress once per affected student and course;
+# `report(submission, error)` is called as each one finishes
+def regrade_submissions(submissions, workers, batch_size=100, report=None):
+    questions = {}
+    affected = set()
+    batch = []
+    failed = 0
+
+    def question_for(submission):
+        object_id = submission.activity_completion.activity.object_id
+        if object_id not in questions:
+            questions[object_id] = CodeQuestion.objects.get(id=object_id)
+        return questions[object_id]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_regrade_one, s, question_for(s)) for s in submissions.iterator()]
+        for future in futures:
+            submission, outcome = future.result()
+            error = outcome if isinstance(outcome, str) else None
+            if report:
+                report(submission, error)
+            if error:
+                # Keep the stored result rather than replacing it with a grading failure
+                failed += 1
+                continue
+
+            batch.append((submission, outcome))
+            ac = submission.activity_completion
+            affected.add((ac.student, ac.activity.course_topic.course))
+            if len(batch) >= batch_size:
+                _save_batch(batch)
+                batch = []
+
+    if batch:
+        _save_batch(batch)
+
+    for student, course in affected:
+        try:
+            update_student_progress(student, course)
+        except StudentCourseEnrollment.DoesNotExist:
+            continue  # No longer enrolled
+
+    return len(futures) - failed, failed
@@ -0,0 +1,140 @@
+import functools
+import io
+import json
+import os
+import posixpath
+import re
+import subprocess
+import tarfile
+from django.conf import settings
+from base.grading.docker_api import docker, runner_host_config
+from base.grading.pool import RUNNER_COMMANDS, PoolUnavailable, runner_env, runner_pool, pool_enabled
+
+
+# File name the runner expects the student's code in
+def student_filename(code, language):
+    # Detect class name from student Java code
+    class_name = "Solution"  # fallback
+    if language == "java":
+        match = re.search(r'public\s+class\s+(\w+)', code)
+        if match:
+            class_name = match.group(1)
+
+    return f"{class_name}.java" if language == "java" else "solution.py"
+
+
+# Write the student's code (tests come from the question's prebuilt bundle)
+def write_student_files(code, student_path, language):
+    os.makedirs(student_path, exist_ok=True)
+    with open(os.path.join(student_path, student_filename(code, language)), "w") as f:
+        f.write(code)
+
+
+# A bundle's files, read once per bundle (a bundle never changes after it is built)
+@functools.lru_cache(maxsize=64)
+def _bundle_files(tests_path):
+    files = []
+    for name in sorted(os.listdir(tests_path)):
+        with open(os.path.join(tests_path, name), "rb") as f:
+            files.append((name, f.read()))
+    return tuple(files)
+
+
+def _add_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644  # Writable copies, so the runner can clean up its scratch directory
+    tar.addfile(info, io.BytesIO(data))
+
+
+# In-memory tar of student code and a test bundle for a runner in archive mode. `codes` maps a
+# batch subdirectory of student/ ("" for a single submission) to its code
+def build_archive(codes, tests_path, language):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        for subdir, code in codes.items():
+            _add_file(tar, posixpath.join("student", subdir, student_filename(code, language)), code.encode())
+        for name, data in _bundle_files(os.path.abspath(tests_path)):
+            _add_file(tar, posixpath.join("tests", name), data)
+    return buffer.getvalue()
+
+
+# The runner's stdout, or an error result in the runner's format when the runner didn't exit
+# cleanly (e.g. the container was killed for running out of memory). Output from a runner that
+# was killed is never trusted, since student code may have written it before killing the runner
+def runner_output(result):
+    if result.exit_code == 0:
+        return result.stdout.decode(errors="replace").strip()
+
+    if result.oom_killed or result.exit_code == 137:
+        error = f"The grader ran out of memory ({settings.CODE_RUNNER_MEMORY}) and was stopped"
+    else:
+        stderr = result.stderr.decode(errors="replace").strip()
+        error = f"The grader exited with status {result.exit_code}" + (f": {stderr[-500:]}" if stderr else "")
+    return json.dumps({
+        "results": [],
+        "summary": {"passed": 0, "total": 0, "all_passed": False},
+        "error": error,
+        "runner_failed": True,
+    })
+
+
+# Run tests in a Docker container through the Engine API and capture its output
+def run_docker(student_path, tests_path, language, timeout=None, batch=False):
+    timeout = timeout or settings.CODE_RUNNER_TIMEOUT
+
+    # Prefer a warm container from the pool over cold-starting a new one
+    if pool_enabled(language):
+        try:
+            return runner_output(runner_pool.run(
+                language, timeout, lambda container: container.run_job(student_path, tests_path, timeout, batch)
+            ))
+        except PoolUnavailable:
+            pass  # No warm container to be had (e.g. none have started yet), so start one for this run
+
+    config = {
+        "Image": f"code-runner-{language}",
+        "Env": runner_env(batch) + [
+            "PYTHONDONTWRITEBYTECODE=1",  # Keep the host workspace free of root-owned caches
+        ],
+        "HostConfig": runner_host_config(Binds=[
+            os.path.abspath(student_path) + ":/app/student",
+            os.path.abspath(tests_path) + ":/app/tests:ro",
+        ]),
+    }
+
+    try:
+        result = docker.run(config, timeout)
+    except TimeoutError:
+        raise subprocess.TimeoutExpired(config["Image"], timeout)
+    return runner_output(result)
+
+
+# Runs a runner in archive mode: the archive from build_archive is piped to its stdin and
+# unpacked into a tmpfs inside the container, so nothing is written to the host
+def run_docker_archive(archive, language, timeout=None, batch=False):
+    timeout = timeout or settings.CODE_RUNNER_TIMEOUT
+
+    if pool_enabled(language):
+        try:
+            return runner_output(runner_pool.run(
+                language, timeout, lambda container: container.run_archive(archive, timeout, batch)
+            ))
+        except PoolUnavailable:
+            pass
+
+    config = {
+        "Image": f"code-runner-{language}",
+        "Cmd": RUNNER_COMMANDS[language] + ["--archive"],
+        "Env": runner_env(batch),
+        "AttachStdin": True,
+        "OpenStdin": True,
+        "StdinOnce": True,  # The runner sees end of input once the archive has been sent
+        "HostConfig": runner_host_config(),
+    }
+
+    try:
+        result = docker.run(config, timeout, stdin=archive)
+    except TimeoutError:
+        raise subprocess.TimeoutExpired(config["Image"], timeout)
+    return runner_output(result)
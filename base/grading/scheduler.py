@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from base.models import GradingJob
+from base.grading.docker_api import parse_memory
+
+
+# Grading jobs this host can run at once without oversubscribing its cores or memory
+def grading_capacity():
+    if settings.GRADING_MAX_CONCURRENT_JOBS:
+        return settings.GRADING_MAX_CONCURRENT_JOBS
+
+    by_cpu = int((os.cpu_count() or 1) / float(settings.CODE_RUNNER_CPUS))
+    total_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    free_memory = total_memory - parse_memory(settings.GRADING_MEMORY_RESERVE)
+    by_memory = int(free_memory / parse_memory(settings.CODE_RUNNER_MEMORY))
+    return max(1, min(by_cpu, by_memory))
+
+
+# Grading slots in use: a batch of jobs graded in one runner invocation takes a single slot
+def slots_in_use():
+    running = GradingJob.objects.filter(status="running")
+    return running.filter(batch="").count() + running.exclude(batch="").values("batch").distinct().count()
+
+
+# Queued jobs: sample runs (short, and a student is waiting on the page) first, then students
+# with the fewest running jobs and then oldest first, so one student submitting repeatedly
+# can't hold up everyone else
+def fair_queue():
+    running = (
+        GradingJob.objects.filter(student=OuterRef("student"), status="running")
+        .values("student")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return (
+        GradingJob.objects.filter(status="queued")
+        .annotate(student_running=Coalesce(Subquery(running), 0))
+        .order_by("-sample", "student_running", "created", "id")
+    )
+
+
+# Claims the next job if the host has a free grading slot (None when full or the queue is empty).
+# GRADING_SAMPLE_SLOTS more slots are kept for sample runs, so they never wait for graded
+# submissions to finish; a worker with sample_only=True only ever claims sample runs
+def claim_next_job(sample_only=False):
+    capacity = grading_capacity()
+    while True:
+        in_use = slots_in_use()
+        if in_use >= capacity + settings.GRADING_SAMPLE_SLOTS:
+            return None
+
+        queued = fair_queue()
+        if sample_only or in_use >= capacity:
+            queued = queued.filter(sample=True)
+        job = queued.first()
+        if job is None:
+            return None
+
+        # Only one worker can flip the job from queued to running
+        claimed = GradingJob.objects.filter(id=job.id, status="queued").update(
+            status="running", started=timezone.now()
+        )
+        if not claimed:
+            continue
+
+        # Another worker may have taken the last slot at the same time; give the job back
+        if slots_in_use() > capacity + (settings.GRADING_SAMPLE_SLOTS if job.sample else 0):
+            GradingJob.objects.filter(id=job.id).update(status="queued", started=None, batch="")
+            return None
+
+        job.refresh_from_db()
+        return job
+
+
+# Claims queued jobs for the same question and language as `job` to grade with it in one runner
+# invocation (sample runs are graded on their own). A job fresh off the queue first waits out
+# GRADING_BATCH_WINDOW so others can join it.
+def claim_batch(job):
+    if settings.GRADING_BATCH_SIZE <= 1 or job.sample:
+        return [job]
+
+    wait = settings.GRADING_BATCH_WINDOW - (timezone.now() - job.created).total_seconds()
+    if wait > 0:
+        time.sleep(wait)
+
+    token = uuid.uuid4().hex
+    job.batch = token
+    GradingJob.objects.filter(id=job.id).update(batch=token)
+
+    candidates = list(
+        fair_queue()
+        .filter(question=job.question_id, language=job.language, sample=False)
+        .values_list("id", flat=True)[: settings.GRADING_BATCH_SIZE - 1]
+    )
+    # Jobs another worker claimed in the meantime are no longer queued and are skipped
+    GradingJob.objects.filter(id__in=candidates, status="queued").update(
+        status="running", started=timezone.now(), batch=token
+    )
+    others = GradingJob.objects.filter(batch=token).exclude(id=job.id).order_by("id")
+    return [job, *others]
+
+
+# Queue depth and wait times for sizing the grading host
+def queue_stats(window=3600):
+    now = timezone.now()
+    queued = GradingJob.objects.filter(status="queued")
+    oldest = queued.order_by("created").values_list("created", flat=True).first()
+
+    # Seconds between submission and a worker picking the job up, over the recent window
+    waits = sorted(
+        (started - created).total_seconds()
+        for created, started in GradingJob.objects.filter(
+            started__gte=now - timedelta(seconds=window)
+        ).values_list("created", "started")
+    )
+
+    return {
+        "capacity": grading_capacity(),
+        "running": GradingJob.objects.filter(status="running").count(),
+        "slots_in_use": slots_in_use(),
+        "queued": queued.count(),
+        "oldest_queued_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+        "recent_jobs": len(waits),
+        "avg_wait_seconds": round(sum(waits) / len(waits), 2) if waits else 0,
+        "p95_wait_seconds": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else 0,
+        "max_wait_seconds": round(waits[-1], 2) if waits else 0,
+    }
@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+
+# Creates a throwaway directory for one grading run and removes it afterwards
+@contextmanager
+def grading_workspace():
+    os.makedirs(settings.GRADING_WORKSPACE_ROOT, exist_ok=True)
+    path = tempfile.mkdtemp(dir=settings.GRADING_WORKSPACE_ROOT, prefix="job-")
+    try:
+        yield path
+    finally:
+        if not settings.KEEP_GRADING_WORKSPACES:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# A grading_workspace for the student's files, or None when they are streamed to the runner
+# as an archive instead (GRADING_ARCHIVE_MODE), so grading writes nothing to the host
+@contextmanager
+def submission_workspace():
+    if settings.GRADING_ARCHIVE_MODE:
+        yield None
+    else:
+        with grading_workspace() as path:
+            yield path
+
+
+# Directories that may hold leftover workspace trees (including the old per-submission layout)
+def workspace_roots():
+    roots = [settings.GRADING_WORKSPACE_ROOT, os.path.join(settings.MEDIA_ROOT, "submissions")]
+    return list(dict.fromkeys(os.path.abspath(root) for root in roots))
+
+
+# Removes workspace trees older than max_age seconds and returns the removed paths
+def sweep_workspaces(max_age, dry_run=False):
+    cutoff = time.time() - max_age
+    removed = []
+
+    for root in workspace_roots():
+        if not os.path.isdir(root):
+            continue
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False) or entry.stat().st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                removed.append(entry.path)
+
+    return removed
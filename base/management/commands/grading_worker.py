@@ -0,0 +1,39 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base.models import GradingJob
+from base.grading.jobs import requeue_stale_jobs, run_batch
+from base.grading.scheduler import claim_next_job, claim_batch
+
+
+class Command(BaseCommand):
+    help = "Runs a grading worker that processes queued code submissions (start one per worker process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+        parser.add_argument("--poll-interval", type=float, default=settings.GRADING_POLL_INTERVAL)
+        parser.add_argument(
+            "--sample-only", action="store_true",
+            help="Only run \"Run Sample Tests\" jobs (in the slots GRADING_SAMPLE_SLOTS keeps for them)",
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        while True:
+            # None also when the host is already running as many jobs as it has room for
+            job = claim_next_job(options["sample_only"])
+            if job is None:
+                queued = GradingJob.objects.filter(status="queued")
+                if options["sample_only"]:
+                    queued = queued.filter(sample=True)
+                if options["once"] and not queued.exists():
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            # Queued jobs for the same question join this one and are graded in the same run
+            for job in run_batch(claim_batch(job)):
+                self.stdout.write(f"Job {job.id}: {job.status} {job.error}".strip())
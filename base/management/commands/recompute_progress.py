@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from base.models import Course, StudentCourseEnrollment
+from base.utils import course_activities, completion_totals, progress_totals, update_student_progress
+
+
+class Command(BaseCommand):
+    help = "Recomputes enrollment progress and scores from every completion, repairing the activity summaries and running totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, help="Course id (default: every course)")
+        parser.add_argument("--check", action="store_true", help="Only report enrollments whose totals are out of date")
+
+    def handle(self, *args, **options):
+        enrollments = StudentCourseEnrollment.objects.select_related("student", "course").order_by("id")
+        if options["course"]:
+            if not Course.objects.filter(id=options["course"]).exists():
+                raise CommandError(f"Course {options['course']} does not exist")
+            enrollments = enrollments.filter(course_id=options["course"])
+
+        stale = 0
+        for enrollment in enrollments.iterator():
+            activities = course_activities(enrollment.course)
+            completed, total_score, total_weight = completion_totals(enrollment.student, activities)
+            summarized = progress_totals(enrollment.student, activities)
+            up_to_date = (
+                enrollment.completed_activities == completed
+                and abs(enrollment.score_total - total_score) < 1e-6
+                and abs(enrollment.weight_total - total_weight) < 1e-6
+                and summarized[0] == completed
+                and abs(summarized[1] - total_score) < 1e-6
+                and abs(summarized[2] - total_weight) < 1e-6
+            )
+            if up_to_date:
+                continue
+
+            stale += 1
+            self.stdout.write(
+                f"{enrollment}: {enrollment.completed_activities} completed, score {enrollment.score_total}/"
+                f"{enrollment.weight_total} (expected {completed}, {total_score}/{total_weight})"
+            )
+            if not options["check"]:
+                update_student_progress(enrollment.student, enrollment.course)
+
+        verb = "out of date" if options["check"] else "repaired"
+        self.stdout.write(f"{stale} enrollment(s) {verb}")
@@ -0,0 +1,34 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from base.models import Activity, CodeQuestion, Course
+from base.grading.regrade import submissions_to_regrade, regrade_submissions
+
+
+class Command(BaseCommand):
+    help = "Re-runs stored code submissions against the current test cases and updates scores and progress"
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--question", type=int, help="CodeQuestion id")
+        scope.add_argument("--activity", type=int, help="Activity id")
+        scope.add_argument("--course", type=int, help="Course id")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Submissions graded at once")
+        parser.add_argument("--batch-size", type=int, default=100, help="Submissions saved per database write")
+
+    def handle(self, *args, **options):
+        try:
+            question = CodeQuestion.objects.get(id=options["question"]) if options["question"] else None
+            activity = Activity.objects.get(id=options["activity"]) if options["activity"] else None
+            course = Course.objects.get(id=options["course"]) if options["course"] else None
+        except (CodeQuestion.DoesNotExist, Activity.DoesNotExist, Course.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        submissions = submissions_to_regrade(question=question, activity=activity, course=course)
+        self.stdout.write(f"Regrading {submissions.count()} submission(s) with {options['workers']} worker(s)")
+
+        def report(submission, error):
+            if error:
+                self.stderr.write(f"Submission {submission.id}: {error}")
+
+        regraded, failed = regrade_submissions(submissions, options["workers"], options["batch_size"], report)
+        self.stdout.write(f"Regraded {regraded} submission(s), {failed} failed")
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from base.grading.workspace import sweep_workspaces
+
+
+class Command(BaseCommand):
+    help = "Removes grading workspaces left behind by crashed or interrupted grading runs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age", type=int, default=settings.GRADING_WORKSPACE_RETENTION,
+            help="Only remove workspaces older than this many seconds",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="List what would be removed")
+
+    def handle(self, *args, **options):
+        removed = sweep_workspaces(options["max_age"], dry_run=options["dry_run"])
+        for path in removed:
+            self.stdout.write(path)
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(f"{verb} {len(removed)} workspace(s)")
@@ -293,6 +293,26 @@ class ActivityCompletion(models.Model):
 
     def __str__(self):
         return f"{self.student.username} completed {self.activity}({self.activity.id})"
+
+
+# One row per student and attempted activity, rebuilt from their completions whenever those change
+# (base.utils.rebuild_activity_summaries) so progress pages don't have to rank every attempt
+class StudentActivitySummary(models.Model):
+    student = models.ForeignKey(User, on_delete=models.CASCADE)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+    best_completion = models.ForeignKey(ActivityCompletion, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")  # Highest score
+    latest_completion = models.ForeignKey(ActivityCompletion, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    best_score = models.FloatField(null=True, blank=True)
+    completed_score = models.FloatField(null=True, blank=True)  # Best score over completed attempts (counts towards progress)
+    completed = models.BooleanField(default=False)
+    attempt_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("student", "activity")
+
+    def __str__(self):
+        return f"{self.student.username} on {self.activity} ({self.attempt_count} attempts)"
     
 
 class DmojExercise(models.Model):
@@ -313,6 +333,12 @@ class StudentCourseEnrollment(models.Model):
     score = models.FloatField(null=True, blank=True)
     progress = models.IntegerField(default=0)
 
+    # Running totals over the best completed attempt per activity, kept up to date by
+    # base.utils.progress_change (None until the first full recompute)
+    completed_activities = models.PositiveIntegerField(null=True, blank=True)
+    score_total = models.FloatField(default=0)
+    weight_total = models.FloatField(default=0)
+
     class Meta:
         unique_together = ("student", "course")
 
@@ -333,6 +359,13 @@ class CodeQuestion(models.Model):
         default="stdin",
     )
 
+    # Bumped whenever the test cases change; identifies the prebuilt test bundle
+    test_version = models.PositiveIntegerField(default=1)
+
+    # Per-test limits (a test case can override them)
+    time_limit = models.FloatField(default=2.0, help_text="CPU seconds per test")
+    memory_limit = models.PositiveIntegerField(default=256, help_text="Memory (MB) per test")
+
     created = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -356,6 +389,25 @@ class CodeTestCase(models.Model):
         default="stdin"
     )
 
+    # How the student's output is compared with expected_output (see base/grading/compare.py)
+    COMPARATOR_CHOICES = [
+        ("exact", "Exact (ignoring leading/trailing whitespace)"),
+        ("tokens", "Whitespace-separated tokens"),
+        ("lines", "Line by line (ignoring trailing spaces)"),
+        ("float", "Numbers within tolerance"),
+        ("unordered", "Lines in any order"),
+    ]
+    comparator = models.CharField(
+        max_length=20,
+        choices=COMPARATOR_CHOICES,
+        default="exact"
+    )
+    tolerance = models.FloatField(default=1e-6, help_text="Absolute/relative tolerance for the float comparator")
+
+    # Override the question's limits for this test (blank = use the question's)
+    time_limit = models.FloatField(null=True, blank=True, help_text="CPU seconds")
+    memory_limit = models.PositiveIntegerField(null=True, blank=True, help_text="Memory (MB)")
+
     def __str__(self):
         return f"Test {self.order} for {self.question.title}"
 
@@ -365,12 +417,56 @@ class CodeSubmission(models.Model):
     code = models.TextField()
     results = models.JSONField(null=True, blank=True)
     summary = models.JSONField(null=True, blank=True)
+    test_version = models.PositiveIntegerField(null=True, blank=True)  # CodeQuestion.test_version graded against
+    # Resource usage across the submission's tests, as reported by the runner
+    max_wall_time = models.FloatField(null=True, blank=True)  # seconds, slowest test
+    total_cpu_time = models.FloatField(null=True, blank=True)  # seconds, all tests
+    peak_memory_kb = models.PositiveIntegerField(null=True, blank=True)  # largest test
+    profile = models.JSONField(null=True, blank=True)  # cProfile/tracemalloc summary of a test that ran out of time
     created = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Submission by {self.activity_completion.student.username} for Activity {self.activity_completion.activity.id}"
 
 
+class GradingJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+    question = models.ForeignKey(CodeQuestion, on_delete=models.CASCADE)
+    language = models.CharField(max_length=50)
+    code = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued", db_index=True)
+    activity_completion = models.ForeignKey(ActivityCompletion, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    batch = models.CharField(max_length=32, blank=True, db_index=True)  # Shared by jobs graded in one runner invocation
+    sample = models.BooleanField(default=False)  # "Run Sample Tests": visible tests only, nothing is recorded
+    result = models.JSONField(null=True, blank=True)  # Runner output of a sample run, until the student has seen it
+
+    def __str__(self):
+        return f"Grading job {self.id} for {self.student.username} ({self.status})"
+
+
+class GradingResultCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # sha256 of code, language, test suite and runner version
+    question = models.ForeignKey(CodeQuestion, on_delete=models.CASCADE, related_name="cached_results")
+    data = models.JSONField()  # Runner output (results + summary)
+    hits = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cached result for {self.question.title} ({self.hits} hits)"
+
+
 class CourseWeighting(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     activity_type = models.CharField(max_length=30)
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from base.models import Activity, ActivityCompletion, CodeQuestion, CodeTestCase, CourseUnit, StudentCourseEnrollment
+from base.grading.cache import invalidate_question
+from base.utils import invalidate_student_list, rebuild_activity_summaries, refresh_course_progress
+
+
+# Editing, uploading or deleting test cases makes cached grading results and the test bundle stale
+@receiver(post_save, sender=CodeTestCase)
+@receiver(post_delete, sender=CodeTestCase)
+def code_test_case_changed(sender, instance, **kwargs):
+    invalidate_question(instance.question_id)
+    CodeQuestion.objects.filter(id=instance.question_id).update(test_version=F("test_version") + 1)
+
+
+# Changing a question's time or memory limit changes how every test runs
+@receiver(pre_save, sender=CodeQuestion)
+def code_question_limits_changed(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old = CodeQuestion.objects.filter(id=instance.pk).values("time_limit", "memory_limit", "test_version").first()
+    if old and (old["time_limit"], old["memory_limit"]) != (instance.time_limit, instance.memory_limit):
+        invalidate_question(instance.pk)
+        instance.test_version = old["test_version"] + 1
+
+
+# Keeps the student's summary for the activity in step with their attempts, in the same transaction.
+# QuerySet.update() and bulk_update() skip this, so callers using them rebuild the summaries themselves
+@receiver(post_save, sender=ActivityCompletion)
+@receiver(post_delete, sender=ActivityCompletion)
+def activity_completion_changed(sender, instance, **kwargs):
+    rebuild_activity_summaries(instance.student_id, [instance.activity_id])
+    if settings.STUDENT_LIST_CACHE_SECONDS:
+        course_id = Activity.objects.filter(id=instance.activity_id).values_list("course_topic__course_id", flat=True).first()
+        invalidate_student_list(course_id)
+
+
+# Progress and score changes (and enrollments) show up on the course's student list
+@receiver(post_save, sender=StudentCourseEnrollment)
+@receiver(post_delete, sender=StudentCourseEnrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_student_list(instance.course_id)
+
+
+# Adding or deleting an activity changes every enrolled student's totals without any of their attempts
+# changing (deleting it also takes its completions and summaries with it). Re-weighting goes through
+# update_activity_weights, which refreshes each course once
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, **kwargs):
+    if created:
+        refresh_activity_courses(instance)
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    refresh_activity_courses(instance)
+
+
+# Courses whose activities include this one (the same relation course_activities follows)
+def refresh_activity_courses(activity):
+    course_ids = CourseUnit.objects.filter(unit__coursetopic__id=activity.course_topic_id).values_list(
+        "course_id", flat=True
+    )
+    for course_id in course_ids:
+        refresh_course_progress(course_id)
@@ -192,6 +192,12 @@ function initMonacoEditor() {
         }
 
 
+        // Keep the hidden input current so "Run Sample Tests" (htmx) posts the latest code
+        codeInput.value = editor.getValue();
+        editor.onDidChangeModelContent(() => {
+            codeInput.value = editor.getValue();
+        });
+
         form.addEventListener("submit", function (e) {
             e.preventDefault();
 
@@ -1,3 +1,421 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from base.grading.cache import get_cached_result, result_cache_key, store_result
+from base.grading.compare import apply_comparators, outputs_match
+from base.grading import preflight
+from base.grading.jobs import run_job
+from base.grading.scheduler import claim_next_job, fair_queue, grading_capacity, slots_in_use
+from base.models import (
+    Activity, ActivityCompletion, CodeQuestion, CodeTestCase, Course, CourseTopic, CourseUnit, CourseWeighting,
+    GradingJob, Language, Lesson, Profile, StudentActivitySummary, StudentCourseEnrollment, Topic, Unit,
+)
+from base.utils import (
+    completion_totals, progress_change, progress_totals, rebuild_activity_summaries, refresh_course_progress,
+    update_student_progress,
+)
+from base.views.course_settings_views import update_activity_weights
+
+
+# Enrollment running totals have to follow changes to the course's activities, not just to attempts
+class CourseActivityProgressTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user("teacher", password="pw")
+        Profile.objects.create(user=teacher, role="teacher")
+        self.student = User.objects.create_user("student", password="pw")
+        Profile.objects.create(user=self.student, role="student")
+
+        self.course = Course.objects.create(title="Course", teacher=teacher, language=Language.objects.create(name="Python"))
+        unit = Unit.objects.create(title="Unit")
+        CourseUnit.objects.create(course=self.course, unit=unit)
+        topic = Topic.objects.create(title="Topic", unit=unit)
+        course_topic = CourseTopic.objects.create(course=self.course, unit=unit, topic=topic)
+
+        self.activities = [
+            Activity.objects.create(
+                course_topic=course_topic, content_object=Lesson.objects.create(title=f"Lesson {i}", content=""),
+                order=i, weight=1,
+            )
+            for i in range(1, 3)
+        ]
+        StudentCourseEnrollment.objects.create(student=self.student, course=self.course)
+        update_student_progress(self.student, self.course)
+
+        for activity in self.activities:
+            with progress_change(self.student, self.course, [activity]):
+                ActivityCompletion.objects.create(student=self.student, activity=activity, completed=True, score=1)
+
+    def enrollment(self):
+        return StudentCourseEnrollment.objects.get(student=self.student, course=self.course)
+
+    def test_deleting_an_activity_removes_it_from_the_totals(self):
+        self.assertEqual(self.enrollment().completed_activities, 2)
+
+        self.activities[0].delete()
+
+        enrollment = self.enrollment()
+        self.assertEqual(enrollment.completed_activities, 1)
+        self.assertEqual(enrollment.weight_total, 1)
+        self.assertEqual(enrollment.progress, 100)
+        self.assertEqual(enrollment.score, 100.0)
+
+    def test_adding_an_activity_lowers_progress(self):
+        Activity.objects.create(
+            course_topic=self.activities[0].course_topic,
+            content_object=Lesson.objects.create(title="Lesson 3", content=""), order=3, weight=1,
+        )
+
+        enrollment = self.enrollment()
+        self.assertEqual(enrollment.completed_activities, 2)
+        self.assertEqual(enrollment.progress, 66)  # Stored as a whole percentage
+
+    def test_reweighting_activities_updates_the_weight_total(self):
+        CourseWeighting.objects.update_or_create(course=self.course, activity_type="lesson", defaults={"weight": 4})
+
+        update_activity_weights(self.course)
+
+        enrollment = self.enrollment()
+        self.assertEqual(enrollment.weight_total, 8)
+        self.assertEqual(enrollment.completed_activities, 2)
+        self.assertEqual(enrollment.progress, 100)
+
+    def test_zero_weight_counts_the_same_in_every_total(self):
+        Activity.objects.filter(id=self.activities[0].id).update(weight=0)
+
+        refresh_course_progress(self.course.id)
+        refreshed = self.enrollment()
+        recomputed = update_student_progress(self.student, self.course)
+
+        self.assertEqual(refreshed.weight_total, 2)
+        self.assertEqual(
+            (refreshed.completed_activities, refreshed.score_total, refreshed.weight_total),
+            (recomputed.completed_activities, recomputed.score_total, recomputed.weight_total),
+        )
+        self.assertEqual(progress_totals(self.student, self.activities), completion_totals(self.student, self.activities))
+
+
+# "Run Sample Tests" goes through the grading queue like a submission, but records nothing
+class SampleRunTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user("teacher")
+        Profile.objects.create(user=teacher, role="teacher")
+        student = User.objects.create_user("student")
+        Profile.objects.create(user=student, role="student")
+        self.client.force_login(student)
+
+        course = Course.objects.create(title="Course", teacher=teacher, language=Language.objects.create(name="Python"))
+        unit = Unit.objects.create(title="Unit")
+        topic = Topic.objects.create(title="Topic", unit=unit)
+        course_topic = CourseTopic.objects.create(course=course, unit=unit, topic=topic)
+
+        question = CodeQuestion.objects.create(topic=topic, title="Echo", prompt="")
+        CodeTestCase.objects.create(question=question, input_data="hi", expected_output="hi", is_hidden=False)
+        self.activity = Activity.objects.create(course_topic=course_topic, content_object=question, order=1)
+        self.lesson = Activity.objects.create(
+            course_topic=course_topic, content_object=Lesson.objects.create(title="Lesson", content=""), order=2,
+        )
+
+        # Graded for real by the local backend, with bundles and workspaces in a scratch directory
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        grading = self.settings(
+            GRADING_BACKEND="local", GRADING_ARCHIVE_MODE=False, GRADING_RESULT_CACHE=False,
+            TEST_BUNDLE_ROOT=os.path.join(scratch, "bundles"), GRADING_WORKSPACE_ROOT=os.path.join(scratch, "workspaces"),
+        )
+        grading.enable()
+        self.addCleanup(grading.disable)
+
+    def run_sample(self, activity, code="print(input())"):
+        return self.client.post(reverse("run-sample-code", args=[activity.id]), {"code": code})
+
+    def test_sample_run_is_queued(self):
+        self.run_sample(self.activity, code="print(input().upper())")
+        self.run_sample(self.activity)
+
+        # A second click while the first is still queued just updates its code
+        job = GradingJob.objects.get(sample=True)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(job.code, "print(input())")
+
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+
+        response = self.client.get(reverse("sample-run-status", args=[job.id]))
+        [result] = response.context["results"]
+        self.assertEqual((result["passed"], result["verdict"], result["actual"]), (True, "Passed", "hi"))
+        self.assertIsNone(response.context["error"])
+        self.assertFalse(GradingJob.objects.exists())
+        self.assertFalse(ActivityCompletion.objects.exists())
+
+    def test_code_sent_during_a_run_is_queued_after_it(self):
+        self.run_sample(self.activity)
+        GradingJob.objects.update(status="running")
+
+        self.run_sample(self.activity, code="print(input().upper())")
+
+        follow_up = GradingJob.objects.get(status="queued")
+        self.assertEqual(follow_up.code, "print(input().upper())")
+        run_job(follow_up)
+        response = self.client.get(reverse("sample-run-status", args=[follow_up.id]))
+        [result] = response.context["results"]
+        self.assertEqual((result["passed"], result["verdict"], result["actual"]), (False, "Wrong Answer", "HI"))
+
+    def test_non_code_activity_is_not_found(self):
+        self.assertEqual(self.run_sample(self.lesson).status_code, 404)
+        self.assertFalse(GradingJob.objects.exists())
+
+
+# Stored results are only reused for the same code against the same tests
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        topic = Topic.objects.create(title="Topic", unit=Unit.objects.create(title="Unit"))
+        self.question = CodeQuestion.objects.create(topic=topic, title="Echo", prompt="")
+        self.case = CodeTestCase.objects.create(question=self.question, input_data="hi", expected_output="hi")
+        self.data = {"results": [{"test": "1", "passed": True, "verdict": "Passed"}], "summary": {"passed": 1}}
+
+    def key(self, code="print(input())"):
+        return result_cache_key(code, "python", self.question)
+
+    def test_key_follows_the_code(self):
+        self.assertEqual(self.key(), self.key("print(input())\r\n\n  "))
+        self.assertNotEqual(self.key(), self.key("print(input().strip())"))
+        self.assertNotEqual(self.key(), result_cache_key("print(input())", "java", self.question))
+
+    def test_changing_the_tests_drops_stored_results(self):
+        key, version = self.key(), CodeQuestion.objects.get(id=self.question.id).test_version
+        store_result(key, self.question, self.data)
+        self.assertEqual(get_cached_result(key), self.data)
+
+        self.case.expected_output = "HI"
+        self.case.save()
+
+        self.assertIsNone(get_cached_result(key))
+        self.assertNotEqual(self.key(), key)
+        self.assertGreater(CodeQuestion.objects.get(id=self.question.id).test_version, version)
+
+    def test_changing_a_limit_changes_the_key(self):
+        key = self.key()
+        self.question.time_limit = 5
+        self.question.save()
+        self.assertNotEqual(self.key(), key)
+
+    def test_timeouts_are_not_stored(self):
+        store_result(self.key(), self.question, {
+            "results": [{"test": "1", "passed": False, "verdict": "Timeout"}], "summary": {"passed": 0},
+        })
+        self.assertIsNone(get_cached_result(self.key()))
+
+
+# The queue is served fairly between students and never runs more than the host has room for
+@override_settings(GRADING_MAX_CONCURRENT_JOBS=2, GRADING_SAMPLE_SLOTS=1)
+class SchedulerTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user("teacher")
+        self.alice, self.bob = User.objects.create_user("alice"), User.objects.create_user("bob")
+        course = Course.objects.create(title="Course", teacher=teacher, language=Language.objects.create(name="Python"))
+        unit = Unit.objects.create(title="Unit")
+        topic = Topic.objects.create(title="Topic", unit=unit)
+        course_topic = CourseTopic.objects.create(course=course, unit=unit, topic=topic)
+        self.question = CodeQuestion.objects.create(topic=topic, title="Echo", prompt="")
+        self.activity = Activity.objects.create(course_topic=course_topic, content_object=self.question, order=1)
+
+    def job(self, student, **fields):
+        return GradingJob.objects.create(
+            student=student, activity=self.activity, question=self.question, language="python", code="", **fields
+        )
+
+    def test_students_with_fewer_running_jobs_go_first(self):
+        self.job(self.alice, status="running")
+        alice_queued = self.job(self.alice)
+        bob_queued = self.job(self.bob)
+
+        self.assertEqual(list(fair_queue()), [bob_queued, alice_queued])
+
+    def test_oldest_first_and_sample_runs_ahead(self):
+        first, second = self.job(self.alice), self.job(self.bob)
+        sample = self.job(self.alice, sample=True)
+
+        self.assertEqual(list(fair_queue()), [sample, first, second])
+
+    def test_claims_stop_at_capacity(self):
+        self.assertEqual(grading_capacity(), 2)
+        jobs = [self.job(self.alice) for _ in range(3)]
+
+        self.assertEqual(claim_next_job(), jobs[0])
+        self.assertEqual(claim_next_job(), jobs[1])
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(GradingJob.objects.get(id=jobs[2].id).status, "queued")
+
+        # Only a sample run may use the slot kept for them
+        sample = self.job(self.bob, sample=True)
+        self.assertEqual(claim_next_job(), sample)
+        self.assertIsNone(claim_next_job())
+
+    def test_a_batch_takes_one_slot(self):
+        self.job(self.alice, status="running", batch="b1")
+        self.job(self.bob, status="running", batch="b1")
+        self.assertEqual(slots_in_use(), 1)
+
+        queued = self.job(self.bob)
+        self.assertEqual(claim_next_job(), queued)
+
+
+# Tolerant comparators, and the grader re-judging runner results with them
+class ComparatorTests(SimpleTestCase):
+    def test_exact_ignores_only_surrounding_whitespace(self):
+        self.assertTrue(outputs_match("1 2\n", "  1 2  \n\n"))
+        self.assertFalse(outputs_match("1 2", "1  2"))
+
+    def test_tokens_ignore_whitespace(self):
+        self.assertTrue(outputs_match("1 2\n3", "1\t2  3\n", "tokens"))
+        self.assertFalse(outputs_match("1 2 3", "1 2", "tokens"))
+
+    def test_lines_ignore_trailing_whitespace_and_blank_lines_at_the_end(self):
+        self.assertTrue(outputs_match("a\nb", "a  \nb\n\n", "lines"))
+        self.assertFalse(outputs_match("a\nb", "a\n\nb", "lines"))
+
+    def test_float_within_tolerance(self):
+        self.assertTrue(outputs_match("0.3333 x", "0.33333333 x", "float", 1e-3))
+        self.assertFalse(outputs_match("0.3333", "0.34", "float", 1e-3))
+        self.assertFalse(outputs_match("1 2", "1", "float", 1e-3))
+        self.assertFalse(outputs_match("x", "y", "float", 1e-3))
+        self.assertTrue(outputs_match("nan", "NaN", "float", 1e-3))
+
+    def test_unordered_lines(self):
+        self.assertTrue(outputs_match("a\nb\nb", "b\na\nb", "unordered"))
+        self.assertFalse(outputs_match("a\nb\nb", "a\na\nb", "unordered"))
+
+    def test_results_are_rejudged_with_each_tests_comparator(self):
+        tests_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tests_path)
+        with open(os.path.join(tests_path, "manifest.json"), "w") as f:
+            json.dump({"tests": {
+                "1": {"comparator": "float", "tolerance": 0.01},
+                "2": {"comparator": "tokens"},
+                "3": {"comparator": "exact"},
+            }}, f)
+        data = {
+            "results": [
+                {"test": "1", "passed": False, "verdict": "Wrong Answer", "expected": "1.5", "actual": "1.501", "exit_status": 0},
+                {"test": "2", "passed": False, "verdict": "Timeout", "expected": "a b", "actual": "a  b", "exit_status": None},
+                {"test": "3", "passed": False, "verdict": "Wrong Answer", "expected": "a b", "actual": "a  b", "exit_status": 0},
+            ],
+            "summary": {"passed": 0, "total": 3, "all_passed": False},
+        }
+
+        results = apply_comparators(data, tests_path)["results"]
+
+        self.assertEqual([r["verdict"] for r in results], ["Passed", "Timeout", "Wrong Answer"])
+        self.assertEqual(data["summary"], {"passed": 1, "total": 3, "all_passed": False})
+
+
+# Code that can't compile is failed before it is queued; anything the pre-flight can't be sure of goes to the runner
+@override_settings(GRADING_PREFLIGHT=True, GRADING_BACKEND="local")
+class PreflightTests(TestCase):
+    def test_python_syntax_error(self):
+        error = preflight.preflight("def f(:\n    pass", "python")
+        self.assertIn("SyntaxError", error)
+        self.assertIn('"solution.py", line 1', error)
+
+    def test_valid_python_is_graded(self):
+        self.assertIsNone(preflight.preflight("print(input())", "python"))
+
+    def test_python_too_nested_to_check_is_left_to_the_runner(self):
+        self.assertIsNone(preflight.preflight("x = 1" + " + 1" * 100000, "python"))  # RecursionError
+        self.assertIsNone(preflight.preflight("x = " + "-" * 100000 + "1", "python"))  # MemoryError
+
+    def test_python_is_skipped_for_another_runner_version(self):
+        with override_settings(GRADING_BACKEND="docker"), mock.patch.object(preflight, "PYTHON_RUNNER_VERSION", (2, 7)):
+            self.assertIsNone(preflight.preflight("def f(:", "python"))
+
+    def test_java_is_skipped_without_a_matching_javac(self):
+        with mock.patch.object(preflight.shutil, "which", return_value=None):
+            self.assertIsNone(preflight.preflight("public class Solution {", "java"))
+        with mock.patch.object(preflight.shutil, "which", return_value="/usr/bin/javac"), \
+                mock.patch.object(preflight, "javac_version", return_value=11):
+            self.assertIsNone(preflight.preflight("public class Solution {", "java"))
+
+    def test_disabled(self):
+        with override_settings(GRADING_PREFLIGHT=False):
+            self.assertIsNone(preflight.preflight("def f(:", "python"))
+
+    def test_compile_error_fails_every_hidden_test(self):
+        topic = Topic.objects.create(title="Topic", unit=Unit.objects.create(title="Unit"))
+        question = CodeQuestion.objects.create(topic=topic, title="Echo", prompt="")
+        for is_hidden in (True, True, False):
+            CodeTestCase.objects.create(question=question, input_data="", expected_output="", is_hidden=is_hidden)
+
+        data = preflight.compile_error_result(question, "SyntaxError")
+
+        self.assertEqual(data["summary"], {"passed": 0, "total": 2, "all_passed": False})
+        self.assertEqual({r["verdict"] for r in data["results"]}, {"Compile Error"})
+        self.assertEqual(data["error"], "SyntaxError")
+
+
+# Attempt summaries are kept by the completion signals; a rebuild from scratch has to agree with them
+class ActivitySummaryTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user("teacher")
+        self.student = User.objects.create_user("student")
+        course = Course.objects.create(title="Course", teacher=teacher, language=Language.objects.create(name="Python"))
+        unit = Unit.objects.create(title="Unit")
+        course_topic = CourseTopic.objects.create(course=course, unit=unit, topic=Topic.objects.create(title="Topic", unit=unit))
+        self.activity = Activity.objects.create(
+            course_topic=course_topic, content_object=Lesson.objects.create(title="Lesson", content=""), order=1,
+        )
+
+    def attempt(self, score, completed, minutes):
+        return ActivityCompletion.objects.create(
+            student=self.student, activity=self.activity, score=score, completed=completed,
+            date_completed=timezone.now() + timedelta(minutes=minutes),
+        )
+
+    def summary(self):
+        return StudentActivitySummary.objects.get(student=self.student, activity=self.activity)
+
+    def test_summary_follows_the_attempts(self):
+        first = self.attempt(60, True, 0)
+        best = self.attempt(90, False, 1)  # Best score, but not completed
+        latest = self.attempt(None, False, 2)
+
+        summary = self.summary()
+        self.assertEqual(summary.attempt_count, 3)
+        self.assertEqual((summary.best_score, summary.best_completion_id), (90, best.id))
+        self.assertEqual(summary.completed_score, 60)
+        self.assertTrue(summary.completed)
+        self.assertEqual(summary.latest_completion_id, latest.id)
+
+        first.delete()
+        summary = self.summary()
+        self.assertEqual(summary.attempt_count, 2)
+        self.assertFalse(summary.completed)
+        self.assertIsNone(summary.completed_score)
+
+    def test_deleting_every_attempt_removes_the_summary(self):
+        self.attempt(50, True, 0).delete()
+
+        self.assertFalse(StudentActivitySummary.objects.filter(student=self.student).exists())
+
+    def test_rebuild_matches_the_signals(self):
+        self.attempt(40, True, 0)
+        self.attempt(80, True, 1)
+        fields = [
+            "best_completion_id", "latest_completion_id", "best_score", "completed_score",
+            "completed", "attempt_count", "last_activity",
+        ]
+        kept = StudentActivitySummary.objects.values(*fields).get()
+
+        StudentActivitySummary.objects.all().delete()
+        rebuild_activity_summaries(self.student.id, [self.activity.id])
+
+        self.assertEqual(StudentActivitySummary.objects.values(*fields).get(), kept)
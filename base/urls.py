@@ -17,6 +17,11 @@ urlpatterns = [
 
 ### URLS for code_runner_views.py
     path("submit-code/", views.submit_code, name="submit-code"),
+    path("code_questions/sample/<int:activity_id>/", views.run_sample_code, name="run-sample-code"),
+    path("code_questions/sample/run/<int:job_id>/", views.sample_run_status, name="sample-run-status"),
+    path("code_questions/grading/<int:job_id>/", views.grading_job, name="grading-job"),
+    path("code_questions/grading/<int:job_id>/status/", views.grading_job_status, name="grading-job-status"),
+    path("code_questions/grading/queue/", views.grading_queue_stats, name="grading-queue-stats"),
     path("dev/code-editor-test/", views.test_code_component),
     path("code_questions/results/<int:ac_id>/", views.code_question_results, name="code-question-results"),
 
@@ -1,6 +1,12 @@
 import requests
+import time
+from contextlib import contextmanager
 from urllib.parse import urlparse
-from base.models import Course, StudentCourseEnrollment, Activity, ActivityCompletion
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+from base.models import Course, StudentCourseEnrollment, Activity, ActivityCompletion, StudentActivitySummary
 
 # DMOJ: Gets metadata from a problem URL
 def fetch_dmoj_metadata_from_url(url):
@@ -94,7 +100,11 @@ def extract_code_question_zip(zip_file):
                 "input_data": input_data,
                 "expected_output": expected_output,
                 "order": i,
-                "test_style": meta.get("test_style", "stdin")
+                "test_style": meta.get("test_style", "stdin"),
+                "comparator": case.get("comparator", meta.get("comparator", "exact")),
+                "tolerance": case.get("tolerance", meta.get("tolerance", 1e-6)),
+                "time_limit": case.get("time_limit"),
+                "memory_limit": case.get("memory_limit"),
             })
 
     return test_cases, meta
@@ -121,7 +131,11 @@ def extract_code_question_yaml(yaml_file):
             "input_data": case.get("input", ""),
             "expected_output": case.get("output", ""),
             "order": i,
-            "test_style": meta.get("test_style", "stdin")
+            "test_style": meta.get("test_style", "stdin"),
+            "comparator": case.get("comparator", meta.get("comparator", "exact")),
+            "tolerance": case.get("tolerance", meta.get("tolerance", 1e-6)),
+            "time_limit": case.get("time_limit"),
+            "memory_limit": case.get("memory_limit"),
         })
 
     return test_cases, meta
@@ -138,45 +152,198 @@ def get_all_courses(role, user):
     return courses
 
 
-# Updates the progress and score of a student in a course
-def update_student_progress(student, course):
-    # Get all activities for this course
-    activities = Activity.objects.filter(
-        course_topic__unit__courseunit__course=course
+def course_activities(course):
+    return Activity.objects.filter(course_topic__unit__courseunit__course=course)
+
+
+# Rebuilds the student's StudentActivitySummary rows for `activities` (ids or a queryset)
+# from their attempts, in one read and one upsert
+def rebuild_activity_summaries(student_id, activities):
+    attempts = (
+        ActivityCompletion.objects
+        .filter(student_id=student_id, activity__in=activities)
+        .order_by("activity_id", F("score").desc(nulls_last=True), "-id")  # Best attempt first per activity
+        .values_list("id", "activity_id", "score", "completed", "date_completed")
     )
 
-    completions = (
+    summaries, latest = {}, {}
+    for completion_id, activity_id, score, completed, date_completed in attempts:
+        summary = summaries.get(activity_id)
+        if summary is None:
+            summary = summaries[activity_id] = StudentActivitySummary(
+                student_id=student_id, activity_id=activity_id, best_completion_id=completion_id, best_score=score
+            )
+        summary.attempt_count += 1
+        if completed:
+            summary.completed = True
+            if score is not None and (summary.completed_score is None or score > summary.completed_score):
+                summary.completed_score = score
+
+        # Most recent attempt, by completion time and then by id
+        key = (date_completed is not None, date_completed, completion_id)
+        if activity_id not in latest or key > latest[activity_id]:
+            latest[activity_id] = key
+            summary.latest_completion_id = completion_id
+            summary.last_activity = date_completed
+
+    with transaction.atomic():
+        StudentActivitySummary.objects.bulk_create(
+            summaries.values(),
+            update_conflicts=True,
+            unique_fields=["student", "activity"],
+            update_fields=[
+                "best_completion", "latest_completion", "best_score", "completed_score",
+                "completed", "attempt_count", "last_activity",
+            ],
+        )
+        # Activities the student no longer has any attempts at
+        StudentActivitySummary.objects.filter(student_id=student_id, activity__in=activities).exclude(
+            activity_id__in=list(summaries)
+        ).delete()
+
+
+# Attempt number for the student's next attempt at an activity
+def next_attempt_number(student, activity):
+    count = StudentActivitySummary.objects.filter(student=student, activity=activity).values_list(
+        "attempt_count", flat=True
+    ).first()
+    return (count or 0) + 1
+
+
+# The weight an activity's score counts with in a course score: its own, or 1 when that is unset or 0.
+# Every running total and recompute sums this, so they can't drift apart
+def activity_weight():
+    return Case(When(activity__weight__gt=0, then=F("activity__weight")), default=Value(1), output_field=IntegerField())
+
+
+# (activities completed, sum of best scores, sum of weights) over the student's summaries for
+# `activities`, counting each activity's best completed, scored attempt
+def progress_totals(student, activities):
+    best = StudentActivitySummary.objects.filter(
+        student=student, activity__in=activities, completed_score__isnull=False
+    ).values_list("completed_score", activity_weight())
+
+    completed, total_score, total_weight = 0, 0.0, 0.0
+    for completed_score, weight in best:
+        completed += 1
+        total_score += completed_score
+        total_weight += weight
+    return completed, total_score, total_weight
+
+
+# Same as progress_totals, straight from the completions (for checking the summaries)
+def completion_totals(student, activities):
+    best = (
         ActivityCompletion.objects
-        .filter(student=student, activity__in=activities)
-        .select_related("activity")
-        .order_by("activity_id", "-score")  # Ensures highest score comes first per activity
+        .filter(student=student, activity__in=activities, completed=True, score__isnull=False)
+        .values("activity_id", weight=activity_weight())
+        .annotate(best_score=Max("score"))
     )
 
-    # Pick the best completion per activity
-    best_completions = {}
-    for ac in completions:
-        if ac.activity_id not in best_completions and ac.completed and ac.score is not None:
-            best_completions[ac.activity_id] = ac
+    completed, total_score, total_weight = 0, 0.0, 0.0
+    for row in best:
+        completed += 1
+        total_score += row["best_score"]
+        total_weight += row["weight"]
+    return completed, total_score, total_weight
 
-    # Progress: % of activities completed (best attempt per activity)
-    total_activities = len(activities)
-    completed_activities = len(best_completions)
-    progress = round((completed_activities / total_activities) * 100, 1) if total_activities > 0 else 0
 
-    # Weighted average score using best attempts
-    total_score = 0
-    total_weight = 0
+PROGRESS_FIELDS = ["completed_activities", "score_total", "weight_total", "progress", "score"]
 
-    for ac in best_completions.values():
-        weight = ac.activity.weight or 1
-        total_weight += weight
-        total_score += ac.score
 
-    score = round(total_score / total_weight * 100, 1) if total_weight > 0 else 0.0
+# Progress (% of activities completed) and weighted score from the enrollment's running totals
+def _set_progress(enrollment, total_activities):
+    completed = enrollment.completed_activities
+    enrollment.progress = round((completed / total_activities) * 100, 1) if total_activities > 0 else 0
+    enrollment.score = (
+        round(enrollment.score_total / enrollment.weight_total * 100, 1) if enrollment.weight_total > 0 else 0.0
+    )
+
+
+def _save_progress(enrollment, total_activities):
+    _set_progress(enrollment, total_activities)
+    enrollment.save(update_fields=PROGRESS_FIELDS)
 
-    # Save to StudentCourseEnrollment
-    enrollment = StudentCourseEnrollment.objects.get(student=student, course=course)
-    enrollment.progress = progress
-    enrollment.score = score
-    enrollment.save()
 
+# Recomputes the progress and score of a student in a course from all of their completions.
+# Day-to-day changes go through progress_change; this is for repairing the summaries and running totals
+def update_student_progress(student, course):
+    activities = course_activities(course)
+    enrollment = StudentCourseEnrollment.objects.get(student=student, course=course)
+    rebuild_activity_summaries(student.id, activities)
+    enrollment.completed_activities, enrollment.score_total, enrollment.weight_total = progress_totals(
+        student, activities
+    )
+    _save_progress(enrollment, activities.count())
+    return enrollment
+
+
+# Wraps a change to a student's completions of `activities` and applies just its effect on
+# those activities to the enrollment's running totals, instead of rescanning the whole course
+@contextmanager
+def progress_change(student, course, activities):
+    with transaction.atomic():
+        # Serializes changes for this enrollment so each sees the totals the last one left
+        enrollment = StudentCourseEnrollment.objects.select_for_update().get(student=student, course=course)
+        before = progress_totals(student, activities)
+        yield
+
+        if enrollment.completed_activities is None:
+            update_student_progress(student, course)
+            return
+
+        after = progress_totals(student, activities)
+        enrollment.completed_activities += after[0] - before[0]
+        enrollment.score_total += after[1] - before[1]
+        enrollment.weight_total += after[2] - before[2]
+        _save_progress(enrollment, course_activities(course).count())
+
+
+# Recomputes the running totals of every enrollment in a course from the activity summaries. For changes
+# to the course's activities themselves (one deleted, added or re-weighted), which no attempt goes through
+def refresh_course_progress(course_id):
+    activities = course_activities(course_id)
+    with transaction.atomic():
+        enrollments = list(StudentCourseEnrollment.objects.select_for_update().filter(course_id=course_id))
+        if not enrollments:
+            return
+        totals = {
+            row["student_id"]: row
+            for row in StudentActivitySummary.objects
+            .filter(student_id__in=[e.student_id for e in enrollments], activity__in=activities,
+                    completed_score__isnull=False)
+            .values("student_id")
+            .annotate(
+                completed=Count("id"),
+                score_total=Sum("completed_score"),
+                weight_total=Sum(activity_weight()),
+            )
+        }
+
+        total_activities = activities.count()
+        for enrollment in enrollments:
+            row = totals.get(enrollment.student_id, {})
+            enrollment.completed_activities = row.get("completed", 0)
+            enrollment.score_total = row.get("score_total") or 0.0
+            enrollment.weight_total = row.get("weight_total") or 0.0
+            _set_progress(enrollment, total_activities)
+        StudentCourseEnrollment.objects.bulk_update(enrollments, PROGRESS_FIELDS)
+
+    invalidate_student_list(course_id)  # bulk_update() sends no signals
+
+
+# Cached student lists are keyed on a per-course version, so replacing the version
+# retires every cached sort order of the course at once
+def student_list_version(course_id):
+    key = f"student-list-version:{course_id}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+# Called on completion and progress changes; a no-op unless STUDENT_LIST_CACHE_SECONDS is set
+def invalidate_student_list(course_id):
+    if settings.STUDENT_LIST_CACHE_SECONDS:
+        cache.set(f"student-list-version:{course_id}", time.time_ns(), None)
@@ -1,69 +1,16 @@
-from django.utils import timezone
-import os
-import uuid
-import json
-import subprocess
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.conf import settings
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from base.decorators import allowed_roles
-from base.utils import get_all_courses, update_student_progress
-from base.models import CodeQuestion, ActivityCompletion, Activity, CourseUnit, CodeSubmission
-from django.db import transaction
-import re
-
-# Create test files and test cases
-def write_test_files(code, question, student_path, tests_path, language):
-    os.makedirs(student_path, exist_ok=True)
-    os.makedirs(tests_path, exist_ok=True)
-
-    # Detect class name from student Java code
-    class_name = "Solution"  # fallback
-    if language == "java":
-        match = re.search(r'public\s+class\s+(\w+)', code)
-        if match:
-            class_name = match.group(1)
-
-    filename = f"{class_name}.java" if language == "java" else "solution.py"
-
-    with open(os.path.join(student_path, filename), "w") as f:
-        f.write(code)
-
-    for i, case in enumerate(
-        question.test_cases.filter(is_hidden=True).order_by("order"), start=1
-    ):
-        with open(os.path.join(tests_path, f"{i}.in"), "w") as f_in:
-            f_in.write(case.input_data)
-        with open(os.path.join(tests_path, f"{i}.out"), "w") as f_out:
-            f_out.write(case.expected_output)
-
-
-
-# Run tests in Docker container and capture output
-def run_docker(student_path, tests_path, language):
-    image = f"code-runner-{language}"
-
-    docker_cmd = [
-        "docker", "run", "--rm",
-        "--memory=256m",
-        "--cpus=0.5",
-        "--pids-limit=64",
-        "-v", os.path.abspath(student_path) + ":/app/student",
-        "-v", os.path.abspath(tests_path) + ":/app/tests",
-        image
-    ]
-
-    result = subprocess.run(
-        docker_cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        timeout=10
-    )
-    return result.stdout.decode().strip()
+from base.utils import get_all_courses
+from base.models import CodeQuestion, ActivityCompletion, Activity, CourseUnit, CodeSubmission, GradingJob
+from base.grading.jobs import enqueue_sample_run, enqueue_submission, record_submission
+from base.grading.preflight import preflight, compile_error_result
+from base.grading.scheduler import queue_stats
 
 
-# Submit code and create/save results
+# Submit code and queue it for grading
 @login_required
 @allowed_roles(["student"])
 def submit_code(request):
@@ -77,86 +24,129 @@ def submit_code(request):
         return JsonResponse({"error": "Missing required fields"}, status=400)
 
     question = get_object_or_404(CodeQuestion, id=question_id)
+    activity_id = request.POST.get("activity_id")
+    activity = get_object_or_404(Activity, id=activity_id)
 
-    # Set up file system paths
-    submission_id = str(uuid.uuid4())
-    base_path = os.path.join(settings.MEDIA_ROOT, "submissions", submission_id)
-    student_path = os.path.join(base_path, "student")
-    tests_path = os.path.join(base_path, "tests")
+    # 🔒 Check for existing completion if resubmissions not allowed
+    if not activity.allow_resubmission:
+        ac = ActivityCompletion.objects.filter(
+            student=request.user,
+            activity=activity,
+            completed=True
+        ).first()
+
+        if ac:
+            return redirect("code-question-results", ac.id)
+
+    # Code that doesn't compile fails every test, so record that without running anything
+    language = activity.course_topic.course.language.name.lower()
+    compile_error = preflight(code, language)
+    if compile_error:
+        ac = record_submission(request.user, activity, code, compile_error_result(question, compile_error))
+        return redirect("code-question-results", ac.id)
+
+    # Grading happens in a worker process (manage.py grading_worker)
+    job = enqueue_submission(request.user, activity, question, code)
+    return redirect("grading-job", job.id)
+
+
+# Waiting page shown while a submission is being graded
+@login_required(login_url="login")
+@allowed_roles(["student"])
+def grading_job(request, job_id):
+    job = get_object_or_404(GradingJob, id=job_id, student=request.user, sample=False)
+
+    if job.status == "done":
+        return redirect("code-question-results", job.activity_completion_id)
+
+    context = {
+        "job": job,
+        "activity": job.activity,
+        "question": job.question,
+        "course_id": job.activity.course_topic.course_id,
+        "courses": get_all_courses("student", request.user),
+    }
+    return render(request, "base/main/grading_job.html", context)
+
+
+# Queues the student's code to run against the question's visible tests (htmx partial, nothing is graded)
+@login_required(login_url="login")
+@allowed_roles(["student"])
+def run_sample_code(request, activity_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=405)
 
-    # Run tests in Docker container
-    activity_id = request.POST.get("activity_id")
     activity = get_object_or_404(Activity, id=activity_id)
+    question = activity.content_object
+    if not isinstance(question, CodeQuestion):
+        raise Http404("Not a code question")
+
+    code = request.POST.get("code", "")
     language = activity.course_topic.course.language.name.lower()
+    context = {"results": [], "error": None}
+    compile_error = preflight(code, language) if code.strip() else None
+
+    if not code.strip():
+        context["error"] = "Write some code first."
+    elif not question.test_cases.filter(is_hidden=False).exists():
+        context["error"] = "This question has no sample tests."
+    elif compile_error:
+        context["error"] = compile_error
+    else:
+        # Sample runs share the grading workers (and their limits) with submissions
+        job = enqueue_sample_run(request.user, activity, question, code)
+        return render(request, "base/components/code_question_components/sample_pending.html", {"job": job})
 
-    write_test_files(code, question, student_path, tests_path, language)
-
-    try:
-        output = run_docker(student_path, tests_path, language)
-        print("[DEBUG Docker Output]", output)
-
-        data = json.loads(output)
-
-        results = data.get("results", [])
-        summary = data.get("summary", {})
-        passed = summary.get("all_passed", False)
-
-
-        ac = None
-        if activity and request.user.is_authenticated:
-            # 🔒 Check for existing completion if resubmissions not allowed
-            if not activity.allow_resubmission:
-                ac = ActivityCompletion.objects.filter(
-                    student=request.user,
-                    activity=activity,
-                    completed=True
-                ).first()
-
-                if ac:
-                    return redirect("code-question-results", ac.id)
-
-            # Count attempts for this user + activity
-            previous_attempts = ActivityCompletion.objects.filter(
-                student=request.user,
-                activity=activity
-            ).count()
-
-            # Calculate score
-            total_tests = len(results)
-            passed_tests = sum(1 for r in results if r.get("passed"))
-            score = activity.weight * (passed_tests / total_tests) if total_tests > 0 else 0
-
-            with transaction.atomic():
-                # ✅ Create a new ActivityCompletion
-                ac = ActivityCompletion.objects.create(
-                    student=request.user,
-                    activity=activity,
-                    completed=passed,
-                    score=score,
-                    date_completed=timezone.now(),
-                    attempt_number=previous_attempts + 1
-                )
-
-                # ✅ Save the submission
-                CodeSubmission.objects.create(
-                    activity_completion=ac,
-                    code=code,
-                    results=results,
-                    summary=summary,
-                )
-
-                # ✅ Update course-level progress and score
-                update_student_progress(
-                    request.user,
-                    activity.course_topic.course
-                )
+    return render(request, "base/components/code_question_components/sample_results.html", context)
 
-        return redirect("code-question-results", ac.id)
 
-    except subprocess.TimeoutExpired:
-        return JsonResponse({"error": "Code execution timed out"}, status=408)
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "Failed to parse grading output"}, status=500)
+# Polled by the pending sample run partial until the run has finished
+@login_required(login_url="login")
+@allowed_roles(["student"])
+def sample_run_status(request, job_id):
+    job = get_object_or_404(GradingJob, id=job_id, student=request.user, sample=True)
+
+    if job.status in ("queued", "running"):
+        return render(request, "base/components/code_question_components/sample_pending.html", {"job": job})
+
+    if job.status == "done":
+        context = {"results": job.result.get("results", []), "error": job.result.get("error")}
+    else:
+        context = {"results": [], "error": job.error}
+
+    # The results only live in the student's page from here on
+    job.delete()
+    return render(request, "base/components/code_question_components/sample_results.html", context)
+
+
+# Cheap status endpoint polled by the waiting page
+@login_required(login_url="login")
+@allowed_roles(["student"])
+def grading_job_status(request, job_id):
+    job = get_object_or_404(
+        GradingJob.objects.only("id", "status", "activity_completion_id"),
+        id=job_id,
+        student=request.user,
+        sample=False,
+    )
+
+    data = {"status": job.status}
+    if job.status == "done":
+        data["redirect"] = reverse("code-question-results", args=[job.activity_completion_id])
+    elif job.status == "failed":
+        data["redirect"] = reverse("grading-job", args=[job.id])
+
+    response = JsonResponse(data)
+    if "redirect" in data:
+        response["HX-Redirect"] = data["redirect"]
+    return response
+
+
+# Grading queue depth and wait times (for sizing the grading host)
+@login_required(login_url="login")
+@allowed_roles(["teacher"])
+def grading_queue_stats(request):
+    return JsonResponse(queue_stats())
 
 
 def test_code_component(request):
@@ -200,6 +190,7 @@ def code_question_results(request, ac_id):
             "total": total,
             "all_passed": all_passed,
             "pct": pct,
+            "error": latest_submission.summary.get("error"),
         }
     else:
         summary = {
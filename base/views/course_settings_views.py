@@ -3,7 +3,7 @@ from django.contrib.auth.decorators import login_required
 from base.models import Course, CourseWeighting
 from base.constants import ACTIVITY_TYPE_DISPLAY
 from django.contrib import messages
-from base.utils import get_all_courses
+from base.utils import get_all_courses, refresh_course_progress
 
 @login_required
 def course_settings(request, course_id):
@@ -34,6 +34,7 @@ def update_activity_weights(course):
     weightings = CourseWeighting.objects.filter(course=course)
     weighting_map = {w.activity_type: w.weight for w in weightings}
     print(f"Weighting map: {weighting_map}")
+    changed = False
 
     for ct in course.coursetopic_set.all():
         print(f"  CourseTopic: {ct}")
@@ -50,4 +51,9 @@ def update_activity_weights(course):
             if new_weight is not None and activity.weight != new_weight:
                 activity.weight = new_weight
                 print(f"    → Updating weight to {new_weight}")
-                activity.save()
\ No newline at end of file
+                activity.save()
+                changed = True
+
+    # Enrollments keep running totals of their weights, so they are recomputed for the new ones
+    if changed:
+        refresh_course_progress(course.id)
\ No newline at end of file
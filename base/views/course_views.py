@@ -4,8 +4,10 @@ from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponseBadRequest
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 
-from base.models import Course, CourseUnit, CourseTopic, Activity, ActivityCompletion, StudentCourseEnrollment
+from base.models import Course, CourseUnit, CourseTopic, Activity, StudentActivitySummary, StudentCourseEnrollment
 from base.forms import EnrollmentPasswordForm
 from base.decorators import allowed_roles
 from base.utils import get_all_courses
@@ -24,11 +26,14 @@ def course(request, course_id):
         course = enrollment.course
 
     # Get CourseUnits and preload related Unit
-    course_units = CourseUnit.objects.filter(course=course).select_related("unit")
+    course_units = list(CourseUnit.objects.filter(course=course).select_related("unit"))
 
-    # Attach topics to each CourseUnit's unit
+    # Attach topics (with their activities and this user's progress) to each CourseUnit's unit
+    topics_by_unit = {}
+    for ct in course_topics_with_progress(course, user):
+        topics_by_unit.setdefault(ct.unit_id, []).append(ct)
     for cu in course_units:
-        cu.unit.course_topics = CourseTopic.objects.filter(unit=cu.unit, course=course).select_related("topic")
+        cu.unit.course_topics = topics_by_unit.get(cu.unit_id, [])
 
     password_form = EnrollmentPasswordForm()
 
@@ -43,8 +48,8 @@ def course(request, course_id):
     
     completed_activities = set()
     if user.profile.role == "student":
-        completed_activities = set(ActivityCompletion.objects
-            .filter(student=user, completed=True)
+        completed_activities = set(StudentActivitySummary.objects
+            .filter(student=user, activity__course_topic__course=course, completed=True)
             .values_list("activity_id", flat=True))
 
         # 🔁 Convert to list of ints
@@ -185,12 +190,27 @@ def reorder_item(request, type, id, direction):
     })
 
 
+# Helper function - a course's topics, each with its activities prefetched for the course page and
+# annotated with how many of them there are and how many `user` has completed, in a fixed number of queries
+def course_topics_with_progress(course, user):
+    activities = Activity.objects.select_related("content_type").prefetch_related("content_object")
+    completed = (StudentActivitySummary.objects
+        .filter(student=user, completed=True, activity__course_topic=OuterRef("pk"))
+        .values("activity__course_topic")
+        .annotate(count=Count("id"))
+        .values("count"))
+    return (CourseTopic.objects
+        .filter(course=course)
+        .select_related("topic", "unit")
+        .prefetch_related(Prefetch("activities", queryset=activities))
+        .annotate(
+            activity_total=Count("activities"),
+            activity_completed=Coalesce(Subquery(completed), 0),
+        ))
+
+
 # Helper function - get progress of each CourseUnit and CourseTopic
 def get_progress_maps(student, course_units):
-    completed_ids = set(ActivityCompletion.objects
-        .filter(student=student, completed=True)
-        .values_list("activity_id", flat=True))
-
     topic_progress = {}
     unit_progress = {}
 
@@ -199,10 +219,7 @@ def get_progress_maps(student, course_units):
         unit_completed = 0
 
         for ct in cu.unit.course_topics:
-            activities = ct.activities.all()
-            total = activities.count()
-            completed = sum(1 for a in activities if a.id in completed_ids)
-
+            completed, total = ct.activity_completed, ct.activity_total
             topic_progress[ct.id] = (completed, total)
 
             unit_total += total
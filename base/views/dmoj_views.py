@@ -11,8 +11,7 @@ from django.utils.timezone import now
 from base.decorators import allowed_roles
 from base.models import CourseTopic, DmojExercise, Activity, ActivityCompletion, CourseUnit, StudentCourseEnrollment
 from base.forms import DmojForm
-from base.utils import fetch_dmoj_metadata_from_url, fetch_dmoj_user_data, update_student_progress
-from django.db import transaction
+from base.utils import fetch_dmoj_metadata_from_url, fetch_dmoj_user_data, progress_change
 
 
 
@@ -154,7 +153,8 @@ def refresh_dmoj_progress(request, course_id):
         content_type__model="dmojexercise"
     ).select_related("course_topic", "content_type")
 
-    with transaction.atomic():
+    # Progress is updated for just these activities once they have all been marked
+    with progress_change(request.user, course, activities):
         for activity in activities:
             exercise = activity.content_object
             if exercise is None:
@@ -172,8 +172,5 @@ def refresh_dmoj_progress(request, course_id):
                     }
                 )
 
-        # ✅ Recalculate after all completions
-        update_student_progress(request.user, course)
-
 
     return redirect("course", course_id=course_id)
\ No newline at end of file
@@ -13,8 +13,7 @@ from django.contrib.contenttypes.models import ContentType
 from base.decorators import allowed_roles
 from base.models import Lesson, Activity, ActivityCompletion, CourseTopic, CourseUnit
 from base.forms import LessonForm
-from base.utils import get_all_courses, update_student_progress
-from django.db import transaction
+from base.utils import get_all_courses, progress_change, rebuild_activity_summaries
 
 
 @login_required
@@ -85,7 +84,7 @@ def view_lesson(request, lesson_id):
 
     # Handle completion POST
     if request.method == "POST":
-        with transaction.atomic():
+        with progress_change(request.user, activity.course_topic.course, [activity]):
             if 'mark_as_complete' in request.POST:
                 ActivityCompletion.objects.update_or_create(
                     student=request.user,
@@ -105,11 +104,7 @@ def view_lesson(request, lesson_id):
                     score=None,  # ❌ Remove score if unmarked
                     date_completed=None
                 )
-
-            update_student_progress(
-                request.user,
-                activity.course_topic.course
-            )
+                rebuild_activity_summaries(request.user.id, [activity.id])
 
 
 
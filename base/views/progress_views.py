@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Trim
 from django.shortcuts import get_object_or_404, render
 from base.decorators import allowed_roles
-from base.models import Activity, ActivityCompletion, Course, User, StudentCourseEnrollment
+from base.models import Activity, Course, User, StudentCourseEnrollment, StudentActivitySummary
 from django.utils.timezone import localtime
 from base.constants import ACTIVITY_TYPE_DISPLAY
-from base.utils import get_all_courses
+from base.utils import get_all_courses, student_list_version
 
 
 @login_required
@@ -34,18 +39,13 @@ def student_progress(request, course_id, student_id=None):
     )
 
 
-    # Fetch all completions for the student in this course
-    all_completions = (
-        ActivityCompletion.objects
-        .filter(student=student, activity__in=activities)
-        .order_by("activity_id", "-score")  # highest score first per activity
-    )
-
-    # Keep only the highest score per activity
-    completions = {}
-    for ac in all_completions:
-        if ac.activity_id not in completions:
-            completions[ac.activity_id] = ac
+    # The highest-scoring attempt per activity, from the student's activity summaries
+    completions = {
+        summary.activity_id: summary.best_completion
+        for summary in StudentActivitySummary.objects
+        .filter(student=student, activity__in=activities, best_completion__isnull=False)
+        .select_related("best_completion")
+    }
 
     activity_rows = []
     for activity in activities:
@@ -96,6 +96,42 @@ def student_progress(request, course_id, student_id=None):
 
 
 
+# Sort keys the student list accepts ("-" in front for descending) and the columns they order by
+STUDENT_LIST_SORTS = {
+    "name": ["student__last_name", "student__first_name", "student__username"],
+    "progress": ["progress"],
+    "score": ["score"],
+    "completed": ["completed"],
+    "last_active": ["last_active"],
+}
+
+
+# One row per enrolled student, computed in a single query and sorted by `sort`
+def student_list_rows(course, sort):
+    summaries = StudentActivitySummary.objects.filter(
+        student=OuterRef("student"), activity__course_topic__course=course
+    ).values("student")
+    completed = summaries.filter(completed=True).annotate(count=Count("id")).values("count")
+    last_activity = summaries.annotate(last=Max("last_activity")).values("last")
+
+    descending = sort.startswith("-")
+    ordering = [
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field in STUDENT_LIST_SORTS[sort.lstrip("-")]
+    ]
+    return (
+        StudentCourseEnrollment.objects
+        .filter(course=course)
+        .annotate(
+            name=Trim(Concat("student__first_name", Value(" "), "student__last_name")),
+            completed=Coalesce(Subquery(completed), 0),
+            last_active=Coalesce(Subquery(last_activity), "student__date_joined"),
+        )
+        .order_by(*ordering, "student_id")
+        .values("student_id", "name", "student__email", "progress", "score", "completed", "last_active")
+    )
+
+
 @login_required
 @allowed_roles(["teacher"])
 def student_list(request, course_id):
@@ -105,46 +141,26 @@ def student_list(request, course_id):
     # Target course
     course = get_object_or_404(Course, id=course_id)
 
-    # Enrollments = all students in this course
-    enrollments = (
-        StudentCourseEnrollment.objects
-        .select_related("student__profile")
-        .filter(course=course)
-    )
+    sort = request.GET.get("sort", "name")
+    if sort.lstrip("-") not in STUDENT_LIST_SORTS:
+        sort = "name"
+
+    rows = student_list_rows(course, sort)
+    if settings.STUDENT_LIST_CACHE_SECONDS:
+        key = f"student-list:{course.id}:{student_list_version(course.id)}:{sort}"
+        rows = cache.get_or_set(key, lambda: list(rows), settings.STUDENT_LIST_CACHE_SECONDS)
 
     # Count of activities in the course
     total_activities = Activity.objects.filter(
         course_topic__course=course
     ).count()
 
-    rows = []
-    for enrollment in enrollments:
-        student = enrollment.student
-
-        completions = ActivityCompletion.objects.filter(
-            student=student,
-            activity__course_topic__unit__courseunit__course=course
-        )
-        done = completions.filter(completed=True).values("activity_id").distinct().count()
-
-        last_active = (
-            completions.order_by("-date_completed").first().date_completed
-            if completions.exists()
-            else student.date_joined
-        )
-
-        rows.append({
-            "student_id": student.id,
-            "name": student.get_full_name(),
-            "email": student.email,
-            "progress": enrollment.progress,
-            "score": enrollment.score,
-            "completed": f"{done}/{total_activities}",
-            "last_active": last_active,
-        })
+    page = Paginator(rows, settings.STUDENT_LIST_PAGE_SIZE).get_page(request.GET.get("page"))
 
     return render(request, "base/main/students.html", {
         "courses": courses,
         "course": course,
-        "rows": rows,
+        "page": page,
+        "sort": sort,
+        "total_activities": total_activities,
     })
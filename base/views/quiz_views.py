@@ -14,8 +14,7 @@ from base.models import (
 )
 
 from base.constants import DEFAULT_QUIZ_QUESTION_COUNT, QUIZ_QUESTION_COUNT_OPTIONS
-from base.utils import get_all_courses, update_student_progress
-from django.db import transaction
+from base.utils import get_all_courses, next_attempt_number, progress_change
 
 
 # Quiz Addition
@@ -200,15 +199,14 @@ def take_quiz(request, quiz_id, activity_id):
     courses = get_all_courses("student", request.user)
 
     if request.method == "POST":
-        with transaction.atomic():
+        # Course progress and score are updated as the block exits
+        with progress_change(request.user, course_topic.course, [activity]):
             # Create the ActivityCompletion so we can link answers to it
-            previous_attempts = ActivityCompletion.objects.filter(student=request.user, activity=activity).count()
-
             ac = ActivityCompletion.objects.create(
                 student=request.user,
                 activity=activity,
                 completed=False,
-                attempt_number=previous_attempts + 1,
+                attempt_number=next_attempt_number(request.user, activity),
                 date_completed=timezone.now()
             )
             quiz.activity_completion = ac
@@ -258,12 +256,6 @@ def take_quiz(request, quiz_id, activity_id):
             ac.score = round(weighted_score, 2)
             ac.save()
 
-            # ✅ NEW: Update course progress + score
-            update_student_progress(
-                request.user,
-                activity.course_topic.course
-            )
-
         return redirect("quiz-results", ac.id)
     
     rendered_questions = get_rendered_questions(quiz_questions, question_type)
@@ -339,22 +331,18 @@ def forfeit_quiz(request, quiz_id, activity_id):
 
             # Check if quiz is already completed
             if not ActivityCompletion.objects.filter(student=request.user, activity=activity, completed=True).exists():
-                with transaction.atomic():
-                    previous_attempts = ActivityCompletion.objects.filter(student=request.user, activity=activity).count()
+                with progress_change(request.user, activity.course_topic.course, [activity]):
                     ac = ActivityCompletion.objects.create(
                         student=request.user,
                         activity=activity,
                         completed=True,
-                        attempt_number=previous_attempts + 1,
+                        attempt_number=next_attempt_number(request.user, activity),
                         date_completed=timezone.now(),
                         score=0
                     )
                     quiz.activity_completion = ac
                     quiz.grade = 0
                     quiz.save()
-
-                    # Update student progress
-                    update_student_progress(request.user, activity.course_topic.course)
                     print(f"Created ActivityCompletion ID: {ac.id} for quiz {quiz_id}")
 
                 return JsonResponse({"ac_id": ac.id})
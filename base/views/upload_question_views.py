@@ -12,6 +12,7 @@ from base.decorators import allowed_roles
 from base.forms import MultipleChoiceQuestionForm, TracingQuestionForm, CodeQuestionForm, CodeTestCaseForm, FillInTheBlankQuestionForm
 from base.models import Topic, MultipleChoiceQuestion, TracingQuestion, Language, CodeQuestion, CodeTestCase, FillInTheBlankQuestion
 from base.utils import get_all_courses, extract_code_question_zip, extract_code_question_yaml
+from base.grading.bundles import build_test_bundle
 
 
 # Question type configurations
@@ -290,8 +291,14 @@ def code_question(request, action, question_id=None):
                     expected_output=case["expected_output"],
                     order=case["order"],
                     test_style=case["test_style"],
+                    comparator=case["comparator"],
+                    tolerance=case["tolerance"],
+                    time_limit=case["time_limit"],
+                    memory_limit=case["memory_limit"],
                 )
 
+            build_test_bundle(question)
+
         return redirect("question-bank", question_type="code")
 
     return render(request, "base/main/create_code_question.html", context)
@@ -315,6 +322,7 @@ def code_testcase_form(request, question_id, testcase_id=None):
             testcase = form.save(commit=False)
             testcase.question = question
             testcase.save()
+            build_test_bundle(question)
             
             response = HttpResponse()
             response["HX-Redirect"] = reverse("code-question", args=["edit", question.id])
@@ -334,6 +342,7 @@ def delete_code_testcases(request, question_id):
     ids = request.POST.getlist("testcase_ids")
     if ids:
         CodeTestCase.objects.filter(id__in=ids, question=question).delete()
+        build_test_bundle(question)
     return redirect("code-question", action="edit", question_id=question_id)
 
 
@@ -365,6 +374,12 @@ def upload_code_testcases(request, question_id):
             expected_output=case["expected_output"],
             order=case["order"],
             test_style=case["test_style"],
+            comparator=case["comparator"],
+            tolerance=case["tolerance"],
+            time_limit=case["time_limit"],
+            memory_limit=case["memory_limit"],
         )
 
+    build_test_bundle(question)
+
     return redirect("code-question", action="edit", question_id=question.id)
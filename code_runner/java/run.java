@@ -1,14 +1,129 @@
 import java.io.*;
+import java.lang.management.*;
+import java.lang.reflect.*;
+import java.net.*;
 import java.nio.file.*;
+import java.security.Permission;
 import java.util.*;
 import java.util.concurrent.*;
 
 public class Run {
 
-    private static final Path TEST_DIR = Paths.get("tests");
-    private static final Path CLASS_DIR = Paths.get("classes");
-    private static final Path STUDENT_DIR = Paths.get("student");
-    private static final int EXECUTION_TIMEOUT_SECONDS = 2;
+    // Relative to the working directory, or to the scratch directory the archive is unpacked into
+    private static Path TEST_DIR = Paths.get("tests");
+    private static Path CLASS_DIR = Paths.get("classes");
+    private static Path STUDENT_DIR = Paths.get("student");
+    private static final double DEFAULT_TIME_LIMIT_SECONDS = 2; // CPU time per test when the bundle doesn't set one
+
+    // Most bytes of output kept per test; a test compared exactly is also stopped once its output
+    // is OUTPUT_MARGIN bytes longer than the expected output, since it can no longer pass
+    private static final int OUTPUT_LIMIT = Integer.parseInt(System.getenv().getOrDefault("RUNNER_OUTPUT_LIMIT", "65536"));
+    private static final int OUTPUT_MARGIN = Integer.parseInt(System.getenv().getOrDefault("RUNNER_OUTPUT_MARGIN", "1024"));
+
+    // Most bytes of output a batched submission's runner JVM may send back
+    private static final int BATCH_RESULT_LIMIT = 64 * 1024 * 1024;
+
+    // "jvm" runs every test inside this JVM, "process" launches a fresh JVM per test
+    private static final String RUNNER_MODE = System.getenv().getOrDefault("RUNNER_MODE", "jvm");
+
+    // Set by the grader inside a runner container, where every process orphaned to the container's
+    // init process and owned by the runner's user was started by student code
+    private static final boolean IN_CONTAINER = System.getenv().getOrDefault("RUNNER_CONTAINER", "0").equals("1");
+
+    // The runner's own streams; student code only ever sees redirected ones
+    private static final PrintStream STDOUT = System.out;
+    private static final InputStream STDIN = System.in;
+    private static final PrintStream DISCARD = new PrintStream(OutputStream.nullOutputStream());
+
+    // Student code (and any thread it starts) runs in this group
+    private static final ThreadGroup TEST_THREADS = new ThreadGroup("student-tests");
+
+    // Measures the CPU time of each in-JVM test thread
+    private static final ThreadMXBean THREAD_CPU = ManagementFactory.getThreadMXBean();
+
+    // Thrown instead of exiting the JVM when student code calls System.exit
+    private static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    // Thrown from a student's print call once the test's output passes its cap
+    private static class OutputLimitExceeded extends Error {
+        OutputLimitExceeded() {
+            super("Output limit exceeded");
+        }
+    }
+
+    // Keeps at most `limit` bytes and remembers whether more was written
+    private static class BoundedOutputStream extends OutputStream {
+        private final ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+        private final int limit;
+        private final boolean throwWhenExceeded;
+        private volatile boolean exceeded = false;
+
+        BoundedOutputStream(int limit, boolean throwWhenExceeded) {
+            this.limit = limit;
+            this.throwWhenExceeded = throwWhenExceeded;
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[]{(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            int room = limit - buffer.size();
+            if (len > room) {
+                buffer.write(b, off, Math.max(0, room));
+                exceeded = true;
+                if (throwWhenExceeded) {
+                    throw new OutputLimitExceeded();
+                }
+                return;
+            }
+            buffer.write(b, off, len);
+        }
+
+        boolean exceeded() {
+            return exceeded;
+        }
+
+        @Override
+        public synchronized String toString() {
+            return buffer.toString();
+        }
+    }
+
+    // Allows everything except System.exit (or removing this manager) from a test thread
+    private static class NoExitSecurityManager extends SecurityManager {
+        private static boolean inTestThread() {
+            return Thread.currentThread().getThreadGroup() == TEST_THREADS;
+        }
+
+        @Override
+        public void checkPermission(Permission perm) {
+            if (inTestThread() && perm.getName().equals("setSecurityManager")) {
+                throw new SecurityException("Replacing the security manager is not allowed");
+            }
+        }
+
+        @Override
+        public void checkPermission(Permission perm, Object context) {
+            checkPermission(perm);
+        }
+
+        @Override
+        public void checkExit(int status) {
+            if (inTestThread()) {
+                throw new ExitTrappedException(status);
+            }
+        }
+    }
 
     // Extracts the public class name from a Java file
     private static String findPublicClassName(Path javaFile) throws IOException {
@@ -41,6 +156,19 @@ public class Run {
     // Compiles the Java file
     private static String compileJavaFile(Path javaFile, Path classDir) throws IOException, InterruptedException {
         classDir.toFile().mkdirs();
+
+        // Compile in-process when possible to avoid starting a separate javac JVM
+        javax.tools.JavaCompiler compiler = javax.tools.ToolProvider.getSystemJavaCompiler();
+        if (compiler != null && RUNNER_MODE.equals("jvm")) {
+            ByteArrayOutputStream diagnostics = new ByteArrayOutputStream();
+            int status = compiler.run(null, diagnostics, diagnostics, "-d", classDir.toString(), javaFile.toString());
+            String output = diagnostics.toString().trim();
+            if (status != 0) {
+                return output.isEmpty() ? "Compilation failed" : output;
+            }
+            return null; // Success
+        }
+
         ProcessBuilder pb = new ProcessBuilder("javac", "-d", classDir.toString(), javaFile.toString());
         pb.redirectErrorStream(true);
         Process process = pb.start();
@@ -51,54 +179,325 @@ public class Run {
         return null; // Success
     }
 
+    // Per-test settings written into the bundle by the grader (absent in older bundles)
+    @SuppressWarnings("unchecked")
+    private static Map<String, Map<String, Object>> loadManifest() {
+        try {
+            Map<String, Object> manifest = new com.google.gson.Gson().fromJson(Files.readString(TEST_DIR.resolve("manifest.json")), Map.class);
+            Object tests = manifest == null ? null : manifest.get("tests");
+            return tests instanceof Map ? (Map<String, Map<String, Object>>) tests : Collections.emptyMap();
+        } catch (IOException | com.google.gson.JsonParseException e) {
+            return Collections.emptyMap();
+        }
+    }
+
+    private static double limitValue(Map<String, Object> limits, String key, double fallback) {
+        Object value = limits == null ? null : limits.get(key);
+        return value instanceof Number ? ((Number) value).doubleValue() : fallback;
+    }
+
+    // Limits are on CPU time; the wall clock allows for waiting on I/O and a CPU quota below one core
+    private static long wallLimitMillis(double timeLimit) {
+        return (long) ((timeLimit * 3 + 1) * 1000);
+    }
+
+    // The other comparators (applied by the grader) ignore differences in whitespace or float
+    // digits, so output longer than the expected output may still pass them
+    private static int outputCap(String expected, String comparator) {
+        if (!comparator.equals("exact")) {
+            return OUTPUT_LIMIT;
+        }
+        return Math.min(OUTPUT_LIMIT, expected.getBytes().length + OUTPUT_MARGIN);
+    }
+
+    private static String verdict(boolean passed, boolean failed) {
+        if (passed) {
+            return "Passed";
+        }
+        return failed ? "Runtime Error" : "Wrong Answer";
+    }
+
+    private static void putResult(Map<String, Object> result, boolean passed, String verdict, String expected, String actual, String error) {
+        result.put("passed", passed);
+        result.put("verdict", verdict);
+        result.put("expected", expected);
+        result.put("actual", actual);
+        result.put("error", error);
+    }
+
+    // Wall time, CPU time, peak memory and exit status of a test (null where not measurable)
+    private static void putUsage(Map<String, Object> result, long startNanos, long cpuNanos, Long peakMemoryKb, Integer exitStatus) {
+        result.put("wall_time", Math.round((System.nanoTime() - startNanos) / 1e5) / 1e4);
+        result.put("cpu_time", cpuNanos < 0 ? null : Math.round(cpuNanos / 1e5) / 1e4);
+        result.put("peak_memory_kb", peakMemoryKb);
+        result.put("exit_status", exitStatus);
+    }
+
+    // Heap pools are reset before each in-JVM test so their peaks cover just that test
+    private static List<MemoryPoolMXBean> heapPools() {
+        List<MemoryPoolMXBean> pools = new ArrayList<>();
+        for (MemoryPoolMXBean pool : ManagementFactory.getMemoryPoolMXBeans()) {
+            if (pool.getType() == MemoryType.HEAP && pool.isValid()) {
+                pools.add(pool);
+            }
+        }
+        return pools;
+    }
+
+    private static long peakHeapKb(List<MemoryPoolMXBean> pools) {
+        long peak = 0;
+        for (MemoryPoolMXBean pool : pools) {
+            MemoryUsage usage = pool.getPeakUsage();
+            if (usage != null) {
+                peak += usage.getUsed();
+            }
+        }
+        return peak / 1024;
+    }
+
+    // Streams a process's output into a bounded buffer, killing the process if `stopWhenExceeded` is set
+    private static Thread drain(InputStream in, BoundedOutputStream out, Process stopWhenExceeded) {
+        Thread reader = new Thread(() -> {
+            byte[] chunk = new byte[8192];
+            int n;
+            try {
+                while ((n = in.read(chunk)) != -1) {
+                    out.write(chunk, 0, n);
+                    if (out.exceeded() && stopWhenExceeded != null) {
+                        destroyTree(stopWhenExceeded.toHandle());
+                        return;
+                    }
+                }
+            } catch (IOException ignored) {
+                // Stream closed because the process was killed
+            }
+        });
+        reader.setDaemon(true);
+        reader.start();
+        return reader;
+    }
+
+    // Kills a process and everything it started (children first, while they are still its descendants)
+    private static void destroyTree(ProcessHandle process) {
+        process.descendants().forEach(ProcessHandle::destroyForcibly);
+        process.destroyForcibly();
+    }
+
+    // Kills every process a submission left running: this JVM's descendants and, in a runner
+    // container, daemons that detached themselves and were reparented to the container's init
+    private static void killLeftoverProcesses() {
+        ProcessHandle self = ProcessHandle.current();
+        self.descendants().forEach(ProcessHandle::destroyForcibly);
+        if (!IN_CONTAINER) {
+            return;
+        }
+        Optional<String> user = self.info().user();
+        ProcessHandle.allProcesses()
+                .filter(p -> p.pid() != self.pid() && p.pid() != 1)
+                .filter(p -> p.parent().map(parent -> parent.pid() == 1).orElse(false))
+                .filter(p -> user.isPresent() && p.info().user().equals(user))
+                .forEach(Run::destroyTree);
+    }
+
     // Runs a test case and returns the result
-    private static Map<String, Object> runTestCase(Path inFile, Path outFile, String className, String packageName, Path classDir) {
+    private static Map<String, Object> runTestCase(Path inFile, Path outFile, String className, String packageName, Path classDir,
+                                                   double timeLimit, double memoryLimit, String comparator) {
         Map<String, Object> result = new HashMap<>();
         String testName = inFile.getFileName().toString().replace(".in", "");
         result.put("test", testName);
+        String expected = "";
+        long startNanos = System.nanoTime();
 
         try {
             String input = Files.readString(inFile).trim();
-            String expected = outFile.toFile().exists() ? Files.readString(outFile).trim() : "";
+            expected = outFile.toFile().exists() ? Files.readString(outFile).trim() : "";
 
-            ProcessBuilder pb = new ProcessBuilder("java", "-cp", classDir.toString(), packageName + className);
+            List<String> command = new ArrayList<>(List.of("java", "-cp", classDir.toString()));
+            if (memoryLimit > 0) {
+                command.add("-Xmx" + (long) memoryLimit + "m");
+            }
+            command.add(packageName + className);
+            ProcessBuilder pb = new ProcessBuilder(command);
             pb.redirectErrorStream(false); // Separate error stream for clarity
+            startNanos = System.nanoTime();
             Process process = pb.start();
 
-            // Write input to process
-            try (OutputStream stdin = process.getOutputStream()) {
-                stdin.write(input.getBytes());
-                stdin.flush();
-            }
+            // Read output and error as they are produced, keeping only a bounded amount
+            BoundedOutputStream out = new BoundedOutputStream(outputCap(expected, comparator), false);
+            BoundedOutputStream err = new BoundedOutputStream(OUTPUT_LIMIT, false);
+            Thread outReader = drain(process.getInputStream(), out, process);
+            Thread errReader = drain(process.getErrorStream(), err, null);
 
-            // Read output and error
-            String actual = new String(process.getInputStream().readAllBytes()).trim();
-            String error = new String(process.getErrorStream().readAllBytes()).trim();
+            // Write input to process (on its own thread so a program that never reads can't block us)
+            Thread writer = new Thread(() -> {
+                try (OutputStream stdin = process.getOutputStream()) {
+                    stdin.write(input.getBytes());
+                    stdin.flush();
+                } catch (IOException ignored) {
+                    // The program exited without reading all of its input
+                }
+            });
+            writer.setDaemon(true);
+            writer.start();
 
             // Check timeout
-            if (!process.waitFor(EXECUTION_TIMEOUT_SECONDS, TimeUnit.SECONDS)) {
-                process.destroy();
-                throw new TimeoutException("Execution timed out");
+            if (!process.waitFor(wallLimitMillis(timeLimit), TimeUnit.MILLISECONDS)) {
+                // Only a process that is still running can report its CPU time
+                boolean cpuExceeded = process.toHandle().info().totalCpuDuration()
+                        .map(cpu -> cpu.toNanos() > timeLimit * 1e9).orElse(false);
+                destroyTree(process.toHandle());
+                throw new TimeoutException(cpuExceeded ? "Time Limit Exceeded" : "Timeout");
             }
+            // Anything it started in the background and left running
+            process.descendants().forEach(ProcessHandle::destroyForcibly);
+            // The child's CPU time and peak memory are gone once it exits, so only time and status are kept
+            putUsage(result, startNanos, -1, null, process.exitValue());
+            outReader.join(1000);
+            errReader.join(1000);
 
-            boolean passed = actual.equals(expected);
-            result.put("passed", passed);
-            result.put("expected", expected);
-            result.put("actual", actual);
-            result.put("error", error);
+            String actual = out.toString().trim();
+            String error = err.toString().trim();
+            if (memoryLimit > 0 && error.contains("OutOfMemoryError")) {
+                putResult(result, false, "Memory Limit Exceeded", expected, actual, "Memory Limit Exceeded");
+            } else if (out.exceeded()) {
+                putResult(result, false, "Output Limit Exceeded", expected, actual, "Output limit exceeded");
+            } else {
+                boolean passed = actual.equals(expected);
+                putResult(result, passed, verdict(passed, process.exitValue() != 0), expected, actual, error);
+            }
 
-        } catch (IOException | InterruptedException | TimeoutException e) {
-            result.put("passed", false);
-            result.put("expected", outFile.toFile().exists() ? Files.readString(outFile).trim() : "");
-            result.put("actual", "");
-            result.put("error", e.getMessage());
+        } catch (TimeoutException e) {
+            putResult(result, false, e.getMessage(), expected, "", e.getMessage());
+            putUsage(result, startNanos, -1, null, null);
+        } catch (IOException | InterruptedException e) {
+            putResult(result, false, "Runtime Error", expected, "", e.getMessage());
+            putUsage(result, startNanos, -1, null, null);
         }
 
         return result;
     }
 
-    // Outputs results as JSON
-    private static void outputResults(List<Map<String, Object>> results, int passed) {
+    // Runs a test case inside this JVM: the student class is loaded by its own class loader,
+    // System.in/out/err are redirected and a watchdog stops the test after the timeout
+    private static Map<String, Object> runTestCaseInJvm(Path inFile, Path outFile, String className, String packageName, Path classDir,
+                                                        double timeLimit, double memoryLimit, String comparator) {
+        Map<String, Object> result = new HashMap<>();
+        String testName = inFile.getFileName().toString().replace(".in", "");
+        result.put("test", testName);
+        String expected = "";
+        long startNanos = System.nanoTime();
+
+        try (URLClassLoader loader = new URLClassLoader(new URL[]{classDir.toUri().toURL()}, ClassLoader.getPlatformClassLoader())) {
+            String input = Files.readString(inFile).trim();
+            expected = outFile.toFile().exists() ? Files.readString(outFile).trim() : "";
+
+            // A fresh class loader per test so static state never leaks between tests
+            Method main = loader.loadClass(packageName + className).getMethod("main", String[].class);
+
+            BoundedOutputStream out = new BoundedOutputStream(outputCap(expected, comparator), true);
+            BoundedOutputStream err = new BoundedOutputStream(OUTPUT_LIMIT, false);
+            Throwable[] failure = new Throwable[1];
+            long[] cpuNanos = {-1};
+
+            Thread worker = new Thread(TEST_THREADS, () -> {
+                try {
+                    main.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                    failure[0] = e.getCause();
+                } catch (Throwable e) {
+                    failure[0] = e;
+                } finally {
+                    cpuNanos[0] = THREAD_CPU.getCurrentThreadCpuTime();
+                }
+            }, "test-" + testName);
+            worker.setDaemon(true);
+            worker.setContextClassLoader(loader);
+
+            List<MemoryPoolMXBean> pools = heapPools();
+            pools.forEach(MemoryPoolMXBean::resetPeakUsage);
+            System.setIn(new ByteArrayInputStream(input.getBytes()));
+            System.setOut(new PrintStream(out, true));
+            System.setErr(new PrintStream(err, true));
+            long timeLimitNanos = (long) (timeLimit * 1e9);
+            boolean cpuExceeded = false;
+            try {
+                startNanos = System.nanoTime();
+                long wallDeadline = startNanos + wallLimitMillis(timeLimit) * 1_000_000L;
+                worker.start();
+                // Watch the test thread's CPU time as well as the wall clock
+                while (worker.isAlive()) {
+                    worker.join(10);
+                    if (THREAD_CPU.getThreadCpuTime(worker.getId()) > timeLimitNanos) {
+                        cpuExceeded = true;
+                        break;
+                    }
+                    if (System.nanoTime() > wallDeadline) {
+                        break;
+                    }
+                }
+            } finally {
+                // Anything a runaway thread prints from now on is dropped
+                System.setIn(STDIN);
+                System.setOut(DISCARD);
+                System.setErr(DISCARD);
+            }
+
+            if (worker.isAlive()) {
+                long cpu = THREAD_CPU.getThreadCpuTime(worker.getId());
+                stopThread(worker);
+                putUsage(result, startNanos, cpu, peakHeapKb(pools), null);
+                throw new TimeoutException(cpuExceeded ? "Time Limit Exceeded" : "Timeout");
+            }
+
+            String actual = out.toString().trim();
+            String error = err.toString().trim();
+            Throwable thrown = failure[0];
+            boolean failed = thrown != null
+                    && !(thrown instanceof ExitTrappedException && ((ExitTrappedException) thrown).status == 0);
+            if (failed && !(thrown instanceof ExitTrappedException)) {
+                StringWriter trace = new StringWriter();
+                thrown.printStackTrace(new PrintWriter(trace));
+                error = (error + "\n" + trace).trim();
+            }
+            int exitStatus = thrown instanceof ExitTrappedException ? ((ExitTrappedException) thrown).status : (failed ? 1 : 0);
+            long peakKb = peakHeapKb(pools);
+            putUsage(result, startNanos, cpuNanos[0], peakKb, exitStatus);
+
+            // The heap is shared by every test, so the memory limit is checked against this test's peak
+            boolean memoryExceeded = thrown instanceof OutOfMemoryError || (memoryLimit > 0 && peakKb > memoryLimit * 1024);
+            if (cpuNanos[0] > timeLimitNanos) {
+                putResult(result, false, "Time Limit Exceeded", expected, actual, "Time Limit Exceeded");
+            } else if (memoryExceeded) {
+                putResult(result, false, "Memory Limit Exceeded", expected, actual, "Memory Limit Exceeded");
+            } else if (out.exceeded()) {
+                putResult(result, false, "Output Limit Exceeded", expected, actual, "Output limit exceeded");
+            } else {
+                boolean passed = actual.equals(expected);
+                putResult(result, passed, verdict(passed, failed), expected, actual, error);
+            }
+
+        } catch (TimeoutException e) {
+            putResult(result, false, e.getMessage(), expected, "", e.getMessage());
+        } catch (IOException | ReflectiveOperationException | InterruptedException e) {
+            putResult(result, false, "Runtime Error", expected, "", e.getMessage());
+            putUsage(result, startNanos, -1, null, null);
+        }
+
+        return result;
+    }
+
+    // Forcibly stops a test thread that ignored its timeout
+    @SuppressWarnings({"deprecation", "removal"})
+    private static void stopThread(Thread thread) {
+        try {
+            thread.stop();
+        } catch (UnsupportedOperationException e) {
+            thread.interrupt();
+        }
+    }
+
+    // Results and summary for one submission
+    private static Map<String, Object> resultsOutput(List<Map<String, Object>> results, int passed) {
         Map<String, Object> summary = new HashMap<>();
         summary.put("passed", passed);
         summary.put("total", results.size());
@@ -107,12 +506,11 @@ public class Run {
         Map<String, Object> output = new HashMap<>();
         output.put("results", results);
         output.put("summary", summary);
-
-        System.out.println(new com.google.gson.Gson().toJson(output));
+        return output;
     }
 
-    // Outputs error as JSON
-    private static void outputError(String error, List<Map<String, Object>> results) {
+    // An error that stopped one submission from being graded
+    private static Map<String, Object> errorOutput(String error, List<Map<String, Object>> results) {
         Map<String, Object> summary = new HashMap<>();
         summary.put("passed", 0);
         summary.put("total", results.size());
@@ -122,22 +520,22 @@ public class Run {
         output.put("results", results);
         output.put("summary", summary);
         output.put("error", error);
-
-        System.out.println(new com.google.gson.Gson().toJson(output));
+        return output;
     }
 
-    public static void main(String[] args) {
+    // Compiles whatever is in the student directory and runs it against every test
+    private static Map<String, Object> grade(File[] inputFiles, Map<String, Map<String, Object>> manifest, boolean inJvm) {
         List<Map<String, Object>> results = new ArrayList<>();
 
         // Find student Java file
-        Path javaFile = Arrays.stream(STUDENT_DIR.toFile().listFiles((dir, name) -> name.endsWith(".java")))
+        File[] studentFiles = STUDENT_DIR.toFile().listFiles((dir, name) -> name.endsWith(".java"));
+        Path javaFile = Arrays.stream(studentFiles == null ? new File[0] : studentFiles)
                 .findFirst()
                 .map(File::toPath)
                 .orElse(null);
 
         if (javaFile == null) {
-            outputError("No Java file found in student directory", results);
-            return;
+            return errorOutput("No Java file found in student directory", results);
         }
 
         // Extract class and package names
@@ -147,45 +545,255 @@ public class Run {
             className = findPublicClassName(javaFile);
             packageName = findPackageName(javaFile);
         } catch (IOException e) {
-            outputError("Failed to parse Java file: " + e.getMessage(), results);
-            return;
+            return errorOutput("Failed to parse Java file: " + e.getMessage(), results);
         }
 
         // Compile the Java file
         try {
             String compileError = compileJavaFile(javaFile, CLASS_DIR);
             if (compileError != null) {
-                outputError("Compilation failed: " + compileError.replace("\"", "\\\""), results);
-                return;
+                return errorOutput("Compilation failed: " + compileError.replace("\"", "\\\""), results);
             }
         } catch (IOException | InterruptedException e) {
-            outputError("Compilation error: " + e.getMessage().replace("\"", "\\\""), results);
+            return errorOutput("Compilation error: " + e.getMessage().replace("\"", "\\\""), results);
+        }
+
+        int passed = 0;
+        for (File inFile : inputFiles) {
+            Path outFile = TEST_DIR.resolve(inFile.getName().replace(".in", ".out"));
+            Map<String, Object> limits = manifest.get(inFile.getName().replace(".in", ""));
+            double timeLimit = limitValue(limits, "time_limit", DEFAULT_TIME_LIMIT_SECONDS);
+            double memoryLimit = limitValue(limits, "memory_limit", 0);
+            Object comparator = limits == null ? null : limits.get("comparator");
+            String mode = comparator instanceof String ? (String) comparator : "exact";
+            Map<String, Object> result = inJvm
+                    ? runTestCaseInJvm(inFile.toPath(), outFile, className, packageName, CLASS_DIR, timeLimit, memoryLimit, mode)
+                    : runTestCase(inFile.toPath(), outFile, className, packageName, CLASS_DIR, timeLimit, memoryLimit, mode);
+            if ((boolean) result.get("passed")) {
+                passed++;
+            }
+            results.add(result);
+        }
+
+        return resultsOutput(results, passed);
+    }
+
+    private static void deleteTree(Path path) throws IOException {
+        if (!Files.exists(path, LinkOption.NOFOLLOW_LINKS)) {
             return;
         }
+        try (java.util.stream.Stream<Path> walk = Files.walk(path)) {
+            for (Path p : walk.sorted(Comparator.reverseOrder()).toList()) {
+                Files.delete(p);
+            }
+        }
+    }
+
+    // Deletes everything inside a directory but not the directory itself (which may be a mount point)
+    private static void clearDirectory(Path path) throws IOException {
+        File[] entries = path.toFile().listFiles();
+        for (File entry : entries == null ? new File[0] : entries) {
+            deleteTree(entry.toPath());
+        }
+    }
+
+    // Batch mode: student/ holds one directory per submission. Every submission is read in and
+    // removed up front, so while one is graded the others' code is no longer on disk
+    private static Map<String, Map<String, byte[]>> loadBatch() throws IOException {
+        Map<String, Map<String, byte[]>> batch = new TreeMap<>();
+        File[] dirs = STUDENT_DIR.toFile().listFiles(File::isDirectory);
+        for (File dir : dirs == null ? new File[0] : dirs) {
+            Map<String, byte[]> files = new HashMap<>();
+            File[] sources = dir.listFiles(File::isFile);
+            for (File source : sources == null ? new File[0] : sources) {
+                files.put(source.getName(), Files.readAllBytes(source.toPath()));
+            }
+            batch.put(dir.getName(), files);
+            deleteTree(dir.toPath());
+        }
+        return batch;
+    }
 
-        // Security: Apply SecurityManager or Docker restrictions here
-        // Example: System.setSecurityManager(new SecurityManager());
-        // Docker: Limit CPU, memory, and network access
+    // Grades the submission in student/ in a runner JVM of its own (this runner's command line,
+    // outside batch mode) whose stdout only this runner reads, so the submission's code never
+    // shares a process or an output stream with the runner or another submission
+    private static Object gradeIsolated() {
+        ProcessHandle.Info self = ProcessHandle.current().info();
+        List<String> command = new ArrayList<>();
+        command.add(self.command().orElseThrow());
+        for (String arg : self.arguments().orElseThrow()) {
+            if (!arg.equals("--archive")) {
+                command.add(arg);
+            }
+        }
 
-        // Run test cases
+        try {
+            ProcessBuilder pb = new ProcessBuilder(command);
+            pb.directory(STUDENT_DIR.toAbsolutePath().getParent().toFile());
+            pb.environment().put("RUNNER_BATCH", "0");
+            pb.redirectInput(ProcessBuilder.Redirect.from(new File("/dev/null")));
+            pb.redirectError(ProcessBuilder.Redirect.DISCARD);
+            Process process = pb.start();
+
+            BoundedOutputStream out = new BoundedOutputStream(BATCH_RESULT_LIMIT, false);
+            Thread reader = drain(process.getInputStream(), out, process);
+            int status = process.waitFor();
+            reader.join();
+
+            // Only a single JSON object from a runner that exited cleanly is a result
+            if (status == 0 && !out.exceeded()) {
+                com.google.gson.JsonElement output = com.google.gson.JsonParser.parseString(out.toString());
+                if (output.isJsonObject()) {
+                    return output;
+                }
+            }
+        } catch (IOException | RuntimeException e) {
+            return errorOutput("Runner error: " + e, new ArrayList<>());
+        } catch (InterruptedException e) {
+            Thread.currentThread().interrupt();
+        }
+        return errorOutput("The grader stopped before this submission was graded", new ArrayList<>());
+    }
+
+    // Grades each submission of a batch on its own in student/, clearing its files, classes
+    // and any processes it left running before the next one starts
+    private static Map<String, Object> gradeBatch() throws IOException {
+        Map<String, Object> outputs = new LinkedHashMap<>();
+        for (Map.Entry<String, Map<String, byte[]>> submission : loadBatch().entrySet()) {
+            for (Map.Entry<String, byte[]> file : submission.getValue().entrySet()) {
+                Files.write(STUDENT_DIR.resolve(file.getKey()), file.getValue());
+            }
+            outputs.put(submission.getKey(), gradeIsolated());
+
+            clearDirectory(STUDENT_DIR);
+            clearDirectory(CLASS_DIR);
+            killLeftoverProcesses();
+        }
+        return outputs;
+    }
+
+    // NUL-terminated string field of a tar header
+    private static String tarField(byte[] header, int offset, int length) {
+        int end = offset;
+        while (end < offset + length && header[end] != 0) {
+            end++;
+        }
+        return new String(header, offset, end - offset, java.nio.charset.StandardCharsets.UTF_8);
+    }
+
+    // The "path" record of a pax extended header, if it has one
+    private static String paxPath(byte[] data) {
+        for (String record : new String(data, java.nio.charset.StandardCharsets.UTF_8).split("\n")) {
+            int space = record.indexOf(' ');
+            if (space >= 0 && record.startsWith("path=", space + 1)) {
+                return record.substring(space + 6);
+            }
+        }
+        return null;
+    }
+
+    // With --archive, student/ and tests/ arrive as a tar on stdin. It is unpacked into a fresh
+    // directory under RUNNER_SCRATCH (a tmpfs), so the grader never writes them to the host's disk
+    private static Path unpackArchive(InputStream in) throws IOException {
+        String scratch = System.getenv("RUNNER_SCRATCH");
+        Path root = scratch == null || scratch.isEmpty() ? Paths.get(System.getProperty("java.io.tmpdir")) : Paths.get(scratch);
+        Path base = Files.createTempDirectory(root, "run-").toAbsolutePath();
+
+        DataInputStream tar = new DataInputStream(new BufferedInputStream(in));
+        byte[] header = new byte[512];
+        String longName = null;
+        while (true) {
+            try {
+                tar.readFully(header);
+            } catch (EOFException e) {
+                break;
+            }
+            if (header[0] == 0) {
+                break; // End-of-archive block
+            }
+
+            String name = tarField(header, 0, 100);
+            String prefix = tarField(header, 345, 155);
+            if (longName != null) {
+                name = longName;
+            } else if (!prefix.isEmpty()) {
+                name = prefix + "/" + name;
+            }
+            longName = null;
+
+            String size = tarField(header, 124, 12).trim();
+            byte[] data = new byte[size.isEmpty() ? 0 : Integer.parseInt(size, 8)];
+            tar.readFully(data);
+            tar.skipNBytes((512 - data.length % 512) % 512);
+
+            char type = (char) header[156];
+            if (type == 'L') {
+                longName = tarField(data, 0, data.length);
+            } else if (type == 'x') {
+                longName = paxPath(data);
+            } else if (type == '0' || type == '\0' || type == '5') {
+                Path target = base.resolve(name).normalize();
+                if (!target.startsWith(base)) {
+                    throw new IOException("Archive entry outside the scratch directory: " + name);
+                }
+                if (type == '5') {
+                    Files.createDirectories(target);
+                } else {
+                    Files.createDirectories(target.getParent());
+                    Files.write(target, data);
+                }
+            }
+        }
+
+        TEST_DIR = base.resolve("tests");
+        CLASS_DIR = base.resolve("classes");
+        STUDENT_DIR = base.resolve("student");
+        Files.createDirectories(STUDENT_DIR);
+        return base;
+    }
+
+    public static void main(String[] args) throws IOException {
+        com.google.gson.Gson gson = new com.google.gson.Gson();
+        boolean batch = System.getenv().getOrDefault("RUNNER_BATCH", "0").equals("1");
+        Path scratch = Arrays.asList(args).contains("--archive") ? unpackArchive(STDIN) : null;
+
+        // Security: Docker limits CPU, memory, and network access; in jvm mode a
+        // SecurityManager stops student code from calling System.exit on the runner
+        boolean inJvm = RUNNER_MODE.equals("jvm");
+        if (inJvm) {
+            try {
+                System.setSecurityManager(new NoExitSecurityManager());
+            } catch (UnsupportedOperationException e) {
+                inJvm = false; // JVM started without -Djava.security.manager=allow
+            }
+        }
+
+        // Every submission is run against the same tests
         File[] inputFiles = TEST_DIR.toFile().listFiles((dir, name) -> name.endsWith(".in"));
         if (inputFiles == null || inputFiles.length == 0) {
-            outputError("No test input files found", results);
+            Map<String, Object> error = errorOutput("No test input files found", new ArrayList<>());
+            STDOUT.println(gson.toJson(batch ? Map.of("error", error.get("error")) : error));
             return;
         }
-
         Arrays.sort(inputFiles, Comparator.comparing(File::getName));
-        int passed = 0;
+        Map<String, Map<String, Object>> manifest = loadManifest();
 
-        for (File inFile : inputFiles) {
-            Path outFile = TEST_DIR.resolve(inFile.getName().replace(".in", ".out"));
-            Map<String, Object> result = runTestCase(inFile.toPath(), outFile, className, packageName, CLASS_DIR);
-            if ((boolean) result.get("passed")) {
-                passed++;
+        if (batch) {
+            STDOUT.println(gson.toJson(Map.of("batch", gradeBatch())));
+        } else {
+            STDOUT.println(gson.toJson(grade(inputFiles, manifest, inJvm)));
+        }
+
+        if (scratch != null) {
+            try {
+                deleteTree(scratch);
+            } catch (IOException ignored) {
+                // Left to the container's tmpfs
             }
-            results.add(result);
         }
 
-        outputResults(results, passed);
+        // Don't wait on threads a student program left running
+        STDOUT.flush();
+        System.exit(0);
     }
-}
\ No newline at end of file
+}
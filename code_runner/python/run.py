@@ -5,88 +5,720 @@ import json
 import importlib.util
 import sys
 import io
+import math
+import resource
+import select
+import shutil
+import signal
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-student_file = "student/solution.py"
+student_dir = "student"
+student_file = os.path.join(student_dir, "solution.py")
 test_dir = "tests"
-timeout_seconds = 2
+timeout_seconds = 2  # Default CPU time limit per test when the bundle doesn't set one
+
+# Grade every submission directory under student/ in one run
+batch_mode = os.environ.get("RUNNER_BATCH", "0") == "1"
+
+# With --archive, student/ and tests/ arrive as a tar on stdin and are unpacked into a fresh
+# directory under RUNNER_SCRATCH (a tmpfs), so the grader never writes them to the host's disk
+archive_mode = "--archive" in sys.argv[1:]
+scratch_root = os.environ.get("RUNNER_SCRATCH") or None
+
+# Number of stdin tests run at once (0 = match the container's CPU quota)
+test_workers = int(os.environ.get("RUNNER_WORKERS", "0"))
+
+# Most bytes of output kept per test; a test compared exactly is also stopped once its output
+# is output_margin bytes longer than the expected output, since it can no longer pass
+output_limit = int(os.environ.get("RUNNER_OUTPUT_LIMIT", "65536"))
+output_margin = int(os.environ.get("RUNNER_OUTPUT_MARGIN", "1024"))
+
+# Most bytes of output a batched submission's grading process may send back
+batch_result_limit = 64 * 1024 * 1024
+
+# Rerun the first test that ran out of time under cProfile/tracemalloc and report its hot spots
+profile_enabled = os.environ.get("RUNNER_PROFILE", "0") == "1"
+profile_top = 10
 
 def load_file(path):
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
-def run_stdin_test(input_data, expected_output):
+# The other comparators (applied by the grader) ignore differences in whitespace or float digits,
+# so output longer than the expected output may still pass them
+def output_cap(expected_output, comparator):
+    if comparator != "exact":
+        return output_limit
+    return min(output_limit, len(expected_output.encode()) + output_margin)
+
+def get_verdict(passed, error=""):
+    if passed:
+        return "Passed"
+    return "Runtime Error" if error else "Wrong Answer"
+
+# Limits are on CPU time; the wall clock allows for waiting on I/O and a CPU quota below one core
+def wall_limit(time_limit):
+    return time_limit * 3 + 1
+
+# CPU seconds (SIGXCPU once exceeded) and address space in MB for a test process
+def rlimits(time_limit, memory_limit):
+    cpu = math.ceil(time_limit)
+    limits = [(resource.RLIMIT_CPU, (cpu, cpu + 1))]
+    if memory_limit:
+        limits.append((resource.RLIMIT_AS, (memory_limit * 1024 * 1024,) * 2))
+    return limits
+
+# Sets a limit in this process, within whatever hard limit it already has (one can't be raised)
+def set_rlimit(kind, soft, hard):
+    _, current = resource.getrlimit(kind)
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    resource.setrlimit(kind, (soft, hard))
+
+# "Time Limit Exceeded" / "Memory Limit Exceeded" if the test broke a limit, else None
+def limit_verdict(usage, error, time_limit, memory_limit):
+    cpu_time = usage.get("cpu_time")
+    if (cpu_time is not None and cpu_time > time_limit) or usage.get("exit_status") == -signal.SIGXCPU:
+        return "Time Limit Exceeded"
+    peak = usage.get("peak_memory_kb")
+    if memory_limit and ("MemoryError" in error or (peak is not None and peak > memory_limit * 1024)):
+        return "Memory Limit Exceeded"
+    return None
+
+# Wall time, CPU time, peak memory and exit status of a finished test
+def make_usage(started, exit_status, rusage=None):
+    return {
+        "wall_time": round(time.monotonic() - started, 4),
+        "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 4) if rusage else None,
+        "peak_memory_kb": rusage.ru_maxrss if rusage else None,  # ru_maxrss is in KiB on Linux
+        "exit_status": exit_status,
+    }
+
+# Kills a test and every process it started (each test runs in its own session)
+def kill_group(pid):
     try:
-        result = subprocess.run(
-            ["python", student_file],
-            input=input_data.encode(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=timeout_seconds
-        )
-        actual_output = result.stdout.decode().strip()
-        return actual_output == expected_output.strip(), actual_output, result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return False, "", "Timeout"
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+# Feeds stdin and streams stdout/stderr into bounded buffers. Returns the captured output,
+# "Timeout" or "Output Limit Exceeded" if the process had to be killed, and its resource usage.
+def capture_process(process, input_bytes, stdout_cap, started, deadline):
+    buffers = {process.stdout: bytearray(), process.stderr: bytearray()}
+    readers = list(buffers)
+    writers = [process.stdin]
+    stopped = None
+
+    while readers and stopped is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            stopped = "Timeout"
+            break
+        readable, writable, _ = select.select(readers, writers, [], remaining)
+
+        if writable:
+            try:
+                written = os.write(process.stdin.fileno(), input_bytes[:65536])
+                input_bytes = input_bytes[written:]
+            except BrokenPipeError:
+                input_bytes = b""
+        if writers and not input_bytes:
+            process.stdin.close()
+            writers = []
+
+        for stream in readable:
+            chunk = os.read(stream.fileno(), 65536)
+            if not chunk:
+                readers.remove(stream)
+                continue
+            buffer = buffers[stream]
+            buffer += chunk[:output_limit + 1 - len(buffer)]
+            if stream is process.stdout and len(buffer) > stdout_cap:
+                stopped = "Output Limit Exceeded"
 
-def run_exec_test(input_code, expected_output):
+    if stopped:
+        kill_group(process.pid)
+
+    # Reap the process ourselves (exactly once) to get its resource usage
+    rusage = None
     try:
-        # Redirect stdout
-        old_stdout = sys.stdout
-        sys.stdout = io.StringIO()
-
-        # Load student code as module
-        spec = importlib.util.spec_from_file_location("solution", student_file)
-        solution = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(solution)
-
-        # Execute the test case input in isolated scope
-        local_scope = {"solution": solution}
-        exec(input_code, {}, local_scope)
-
-        # Capture output
-        actual_output = sys.stdout.getvalue().strip()
-        sys.stdout = old_stdout
-        return actual_output == expected_output.strip(), actual_output, ""
-    except Exception as e:
-        sys.stdout = old_stdout
-        return False, "", str(e)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    except ChildProcessError:
+        pass  # Already reaped, so only the exit status (if Popen saw it) is known
+    kill_group(process.pid)  # Anything the test left running in the background
+    usage = make_usage(started, process.returncode, rusage)
 
-def main():
-    in_files = sorted(glob.glob(os.path.join(test_dir, "*.in")))
-    results = []
+    stdout = bytes(buffers[process.stdout][:stdout_cap]).decode(errors="replace")
+    stderr = bytes(buffers[process.stderr][:output_limit]).decode(errors="replace")
+    return stdout, stderr, stopped, usage
+
+def run_stdin_test(input_data, expected_output, time_limit, memory_limit, stdout_cap):
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, student_file],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,  # Lets a kill reach background processes the test started
+    )
+    # Set from here rather than preexec_fn, which isn't safe with the test thread pool
+    for kind, limit in rlimits(time_limit, memory_limit):
+        resource.prlimit(process.pid, kind, limit)
+
+    stdout, stderr, stopped, usage = capture_process(
+        process, input_data.encode(), stdout_cap, started, started + wall_limit(time_limit)
+    )
+    exceeded = limit_verdict(usage, stderr, time_limit, memory_limit)
+    if exceeded:
+        return False, stdout.strip(), exceeded, exceeded, usage
+    if stopped == "Timeout":
+        return False, "", "Timeout", stopped, usage
+    if stopped:
+        return False, stdout.strip(), "Output limit exceeded", stopped, usage
+
+    actual_output = stdout.strip()
+    passed = actual_output == expected_output.strip()
+    return passed, actual_output, stderr, get_verdict(passed, stderr if process.returncode else ""), usage
+
+# Reads one newline-terminated message from a pipe, or None if the deadline passes or more
+# than `limit` bytes arrive first
+def read_message(fd, deadline=None, limit=None):
+    data = b""
+    while not data.endswith(b"\n"):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return None
+        data += chunk
+        if limit is not None and len(data) > limit:
+            return None
+    return json.loads(data)
+
+def send_message(fd, message):
+    os.write(fd, (json.dumps(message) + "\n").encode())
+
+
+# Raised inside an exec test once it prints more than its output cap
+class OutputLimitExceeded(BaseException):
+    pass
+
+class BoundedOutput(io.StringIO):
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def write(self, text):
+        if self.tell() + len(text) > self.limit:
+            super().write(text[:max(0, self.limit - self.tell())])
+            raise OutputLimitExceeded()
+        return super().write(text)
+
+# Imports the student's module once in its own process, then forks a copy-on-write child
+# per exec test so each test is isolated and has its own timeout and stdout capture
+class ForkServer:
+    # The module is imported under the longest of the exec tests' time limits and the largest of
+    # their memory limits (None if any test has none)
+    def start(self, time_limit, memory_limit):
+        request_r, request_w = os.pipe()
+        response_r, response_w = os.pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            os.close(request_w)
+            os.close(response_r)
+            # Exec tests run in forks of this process, so they mustn't inherit the runner's outputs
+            if result_fd is not None:
+                os.close(result_fd)
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.close(devnull)
+            try:
+                self.serve(request_r, response_w, time_limit, memory_limit)
+            finally:
+                os._exit(0)
+
+        os.close(request_r)
+        os.close(response_w)
+        self.requests, self.responses = request_w, response_r
+
+        # A module that never finishes importing fails every exec test
+        self.ready = read_message(self.responses, time.monotonic() + wall_limit(time_limit)) is not None
+        if not self.ready:
+            self.stop()
+
+    def serve(self, requests, responses, time_limit, memory_limit):
+        # Module-level input() should see EOF rather than the runner's stdin
+        sys.stdin = open(os.devnull)
+        sys.stdout = BoundedOutput(output_limit)
+
+        # The import runs under a test's limits. The CPU limit is only a soft one, lifted again
+        # afterwards since this process keeps running (each test sets its own); every test's
+        # memory limit is within memory_limit, so that one can stay
+        cpu_limit = resource.getrlimit(resource.RLIMIT_CPU)
+        for kind, (soft, hard) in rlimits(time_limit, memory_limit):
+            set_rlimit(kind, soft, cpu_limit[1] if kind == resource.RLIMIT_CPU else hard)
+
+        import_error, import_verdict = "", "Runtime Error"
+        solution = None
+        try:
+            spec = importlib.util.spec_from_file_location("solution", student_file)
+            solution = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(solution)
+        except OutputLimitExceeded:
+            import_error, import_verdict = "Output limit exceeded", "Output Limit Exceeded"
+        except BaseException as e:
+            import_error = str(e) or type(e).__name__
+        resource.setrlimit(resource.RLIMIT_CPU, cpu_limit)
+        import_output = sys.stdout.getvalue()
+        send_message(responses, {"ready": True})
+
+        while True:
+            request = read_message(requests)
+            if request is None:
+                return
+            if import_error:
+                send_message(responses, {
+                    "output": import_output[:request["limit"]], "error": import_error, "verdict": import_verdict,
+                    "usage": make_usage(time.monotonic(), 1),
+                })
+                continue
+            send_message(responses, self.run_child(solution, import_output, **request))
+
+    def run_child(self, solution, import_output, code, limit, time_limit, memory_limit):
+        started = time.monotonic()
+        output_r, output_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(output_r)
+            for kind, value in rlimits(time_limit, memory_limit):
+                set_rlimit(kind, *value)
+            sys.stdout = BoundedOutput(limit)
+            sys.stdout.write(import_output[:limit])
+            error, verdict = "", None
+            try:
+                # Execute the test case input in isolated scope
+                exec(code, {}, {"solution": solution})
+            except OutputLimitExceeded:
+                error, verdict = "Output limit exceeded", "Output Limit Exceeded"
+            except BaseException as e:
+                error, verdict = str(e) or type(e).__name__, "Runtime Error"
+            send_message(output_w, {"output": sys.stdout.getvalue(), "error": error, "verdict": verdict})
+            os._exit(1 if error else 0)
+
+        os.close(output_w)
+        result = read_message(output_r, time.monotonic() + wall_limit(time_limit))
+        os.close(output_r)
+        if result is None:
+            os.kill(pid, signal.SIGKILL)
+            result = {"output": "", "error": "Timeout", "verdict": "Timeout"}
+        _, status, rusage = os.wait4(pid, 0)
+        result["usage"] = make_usage(started, os.waitstatus_to_exitcode(status), rusage)
+        return result
+
+    def run(self, input_code, limit, time_limit, memory_limit):
+        started = time.monotonic()
+        if not self.ready:
+            return {"output": "", "error": "Timeout", "verdict": "Timeout", "usage": make_usage(started, None)}
+        send_message(self.requests, {
+            "code": input_code, "limit": limit, "time_limit": time_limit, "memory_limit": memory_limit
+        })
+        # The server enforces the per-test limits; this only guards against the server dying
+        result = read_message(self.responses, time.monotonic() + wall_limit(time_limit) + 5)
+        return result or {
+            "output": "", "error": "Exec test server stopped responding", "verdict": "Runtime Error",
+            "usage": make_usage(started, None),
+        }
+
+    def stop(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+
+def run_exec_test(server, input_code, expected_output, time_limit, memory_limit, stdout_cap):
+    result = server.run(input_code, stdout_cap, time_limit, memory_limit)
+    exceeded = limit_verdict(result["usage"], result["error"], time_limit, memory_limit)
+    if exceeded:
+        return False, result["output"].strip(), exceeded, exceeded, result["usage"]
+    if result["verdict"] == "Output Limit Exceeded":
+        return False, result["output"].strip(), result["error"], result["verdict"], result["usage"]
+    if result["error"]:
+        return False, "", result["error"], result["verdict"], result["usage"]
+    actual_output = result["output"].strip()
+    passed = actual_output == expected_output.strip()
+    return passed, actual_output, "", get_verdict(passed), result["usage"]
+
+# Raised by SIGALRM once a profiling run has used its time
+class ProfileBudgetExceeded(BaseException):
+    pass
+
+# Runs one test in-process under cProfile and tracemalloc for at most time_limit seconds;
+# returns the student's busiest functions and the peak traced memory
+def collect_profile(style, input_data, time_limit, memory_limit):
+    import cProfile
+    import pstats
+    import runpy
+    import tracemalloc
+
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit * 1024 * 1024,) * 2)
+    sys.stdin = io.StringIO(input_data) if style == "stdin" else open(os.devnull)
+    sys.stdout = BoundedOutput(output_limit)
+
+    def stop(signum, frame):
+        raise ProfileBudgetExceeded()
+
+    signal.signal(signal.SIGALRM, stop)
+    profiler = cProfile.Profile()
+    truncated = False
+    tracemalloc.start()
+    signal.setitimer(signal.ITIMER_REAL, time_limit)
+    profiler.enable()
+    try:
+        if style == "stdin":
+            runpy.run_path(student_file, run_name="__main__")
+        else:
+            spec = importlib.util.spec_from_file_location("solution", student_file)
+            solution = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(solution)
+            exec(input_data, {}, {"solution": solution})
+    except ProfileBudgetExceeded:
+        truncated = True
+    except BaseException:
+        pass  # Errors are already reported by the graded run
+    finally:
+        profiler.disable()
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
 
-    for in_file in in_files:
+    # Only the student's own code (the solution file and exec'd test code) is interesting
+    student_path = os.path.abspath(student_file)
+    functions = [
+        {
+            "function": name if filename != "<string>" else f"{name} (test code)",
+            "line": line,
+            "calls": calls,
+            "own_time": round(own_time, 4),
+            "cumulative_time": round(cumulative_time, 4),
+        }
+        for (filename, line, name), (_, calls, own_time, cumulative_time, _) in pstats.Stats(profiler).stats.items()
+        if (filename == "<string>" and style == "exec") or os.path.abspath(filename) == student_path
+    ]
+    functions.sort(key=lambda f: f["cumulative_time"], reverse=True)
+    return {"functions": functions[:profile_top], "peak_memory_kb": peak // 1024, "truncated": truncated}
+
+# Profiles a test in a forked child so the runner's own state is untouched
+def profile_test(style, input_data, time_limit, memory_limit):
+    result_r, result_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(result_r)
+        try:
+            send_message(result_w, collect_profile(style, input_data, time_limit, memory_limit))
+        finally:
+            os._exit(0)
+
+    os.close(result_w)
+    # Code stuck inside a C call never sees the alarm, so the child is killed after a grace period
+    profile = read_message(result_r, time.monotonic() + wall_limit(time_limit) + 1)
+    os.close(result_r)
+    if profile is None:
+        os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    return profile
+
+# CPUs available to this container, honouring a cgroup CPU quota (e.g. docker --cpus)
+def available_cpus():
+    quota_files = [
+        ("/sys/fs/cgroup/cpu.max", None),  # cgroup v2: "<quota> <period>"
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),  # cgroup v1
+    ]
+    for quota_file, period_file in quota_files:
+        try:
+            if period_file is None:
+                quota, period = load_file(quota_file).split()
+            else:
+                quota, period = load_file(quota_file).strip(), load_file(period_file).strip()
+            if quota not in ("max", "-1"):
+                return max(1, math.ceil(int(quota) / int(period)))
+        except (OSError, ValueError):
+            continue
+    return os.cpu_count() or 1
+
+# Per-test settings written into the bundle by the grader (absent in older bundles)
+def load_manifest():
+    try:
+        return json.loads(load_file(os.path.join(test_dir, "manifest.json"))).get("tests", {})
+    except (OSError, ValueError):
+        return {}
+
+def load_tests():
+    manifest = load_manifest()
+    tests = []
+    for in_file in sorted(glob.glob(os.path.join(test_dir, "*.in"))):
         test_name = os.path.basename(in_file).replace(".in", "")
         out_file = os.path.join(test_dir, f"{test_name}.out")
 
         input_data = load_file(in_file)
         expected_output = load_file(out_file) if os.path.exists(out_file) else ""
         style = "exec" if input_data.lstrip().startswith("#exec") else "stdin"
-
         if style == "exec":
             input_data = input_data.replace("#exec", "", 1).lstrip()
-            passed, actual, errors = run_exec_test(input_data, expected_output)
-        else:
-            passed, actual, errors = run_stdin_test(input_data, expected_output)
-
-        results.append({
-            "test": test_name,
-            "passed": passed,
-            "expected": expected_output.strip(),
-            "actual": actual.strip(),
-            "error": errors.strip()
-        })
+
+        limits = manifest.get(test_name, {})
+        time_limit = limits.get("time_limit") or timeout_seconds
+        memory_limit = limits.get("memory_limit")
+        stdout_cap = output_cap(expected_output, limits.get("comparator") or "exact")
+
+        tests.append((test_name, style, input_data, expected_output, time_limit, memory_limit, stdout_cap))
+    return tests
+
+def make_result(test_name, expected_output, passed, actual, errors, verdict, usage):
+    return {
+        "test": test_name,
+        "passed": passed,
+        "verdict": verdict,
+        "expected": expected_output.strip(),
+        "actual": actual.strip(),
+        "error": errors.strip(),
+        **usage
+    }
+
+# Grades whatever is in student/ against the loaded tests
+def grade(tests):
+    results = {}
+
+    # Fork the exec test server before any threads exist
+    server = None
+    exec_limits = [limits for _, style, _, _, *limits in tests if style == "exec"]
+    if exec_limits:
+        memory_limits = [memory_limit for _, memory_limit, _ in exec_limits]
+        server = ForkServer()
+        server.start(
+            max(time_limit for time_limit, _, _ in exec_limits), None if None in memory_limits else max(memory_limits)
+        )
+
+    # stdin tests are independent processes, so they run concurrently on a thread pool;
+    # exec tests go through the fork server one at a time
+    workers = test_workers or available_cpus()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            test_name: executor.submit(run_stdin_test, input_data, expected_output, *limits)
+            for test_name, style, input_data, expected_output, *limits in tests
+            if style == "stdin"
+        }
+
+        for test_name, style, input_data, expected_output, *limits in tests:
+            if style == "exec":
+                results[test_name] = make_result(
+                    test_name, expected_output, *run_exec_test(server, input_data, expected_output, *limits)
+                )
+
+        for test_name, style, input_data, expected_output, *limits in tests:
+            if style == "stdin":
+                results[test_name] = make_result(test_name, expected_output, *futures[test_name].result())
+
+    if server:
+        server.stop()
+
+    # Report in test order regardless of completion order
+    results = [results[test_name] for test_name, *_ in tests]
 
     summary = {
         "passed": sum(1 for r in results if r["passed"]),
         "total": len(results),
         "all_passed": all(r["passed"] for r in results)
     }
-
-    print(json.dumps({
+    output = {
         "results": results,
         "summary": summary
-    }))
+    }
+
+    # Profile the first test that ran out of time (all test threads have finished by now)
+    if profile_enabled:
+        slow = next((r for r in results if r["verdict"] in ("Time Limit Exceeded", "Timeout")), None)
+        if slow:
+            test_name, style, input_data, _, time_limit, memory_limit, _ = next(t for t in tests if t[0] == slow["test"])
+            profile = profile_test(style, input_data, time_limit, memory_limit)
+            if profile:
+                output["profile"] = {"test": test_name, **profile}
+
+    return output
+
+# Batch mode: student/ holds one directory per submission. Every submission is read in and
+# removed up front, so while one is graded the others' code is no longer on disk
+def load_batch():
+    batch = {}
+    for entry in sorted(os.listdir(student_dir)):
+        path = os.path.join(student_dir, entry)
+        if os.path.isdir(path):
+            batch[entry] = {name: load_file(os.path.join(path, name)) for name in os.listdir(path)}
+            shutil.rmtree(path)
+    return batch
+
+def prctl(option, value):
+    try:
+        import ctypes
+        ctypes.CDLL(None, use_errno=True).prctl(option, value, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+# Has orphaned descendants reparented to the runner rather than init, so a daemon a
+# submission starts can still be found (and killed) once that submission is graded
+def become_subreaper():
+    prctl(36, 1)  # PR_SET_CHILD_SUBREAPER
+
+# Student code runs as the runner's user, which could otherwise open the runner's pipes through
+# /proc/<pid>/fd. Not being dumpable makes the runner's /proc entries (and those of the grading
+# processes it forks, which inherit the flag) inaccessible to it; exec'd test processes reset it
+def become_undumpable():
+    prctl(4, 0)  # PR_SET_DUMPABLE
+
+# Process ids of everything descended from the runner
+def descendants():
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = load_file(os.path.join("/proc", entry, "stat"))
+        except OSError:
+            continue
+        # The command name in parentheses may itself contain spaces or parentheses
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    found, parents = [], [os.getpid()]
+    while parents:
+        for pid in children.get(parents.pop(), []):
+            found.append(pid)
+            parents.append(pid)
+    return found
+
+# Kills and reaps every process a submission left running, and removes the files it left in student/
+def clean_up_submission():
+    for _ in range(50):
+        pids = descendants()
+        if not pids:
+            break
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        # Killed processes' own children are reparented to us before they can be reaped
+        time.sleep(0.01)
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+    for entry in os.listdir(student_dir):
+        path = os.path.join(student_dir, entry)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def error_output(error):
+    return {
+        "results": [],
+        "summary": {"passed": 0, "total": 0, "all_passed": False},
+        "error": error,
+    }
+
+# Pipe a batched submission's grading process sends its output on (closed in exec test servers)
+result_fd = None
+
+# Grades the submission in student/ in a forked process of its own. Only that process holds the
+# pipe its output comes back on, and its stdout is /dev/null, so nothing the submission runs can
+# write to the runner's output or another submission's result
+def grade_isolated(tests):
+    global result_fd
+    result_r, result_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(result_r)
+        result_fd = result_w
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+        try:
+            output = grade(tests)
+        except Exception as e:
+            output = error_output(f"Runner error: {e}")
+        try:
+            send_message(result_w, output)
+        finally:
+            os._exit(0)
+
+    os.close(result_w)
+    try:
+        output = read_message(result_r, limit=batch_result_limit)
+    except ValueError:
+        output = None
+    os.close(result_r)
+    try:
+        os.waitpid(pid, 0)
+    except ChildProcessError:
+        pass
+    if not isinstance(output, dict):
+        return error_output("The grader stopped before this submission was graded")
+    return output
+
+# Grades each submission of a batch on its own in student/, which is left empty, with nothing
+# still running, before the next one is written
+def grade_batch(tests):
+    become_subreaper()
+    outputs = {}
+    for submission, files in load_batch().items():
+        for name, source in files.items():
+            with open(os.path.join(student_dir, name), "w", encoding="utf-8") as f:
+                f.write(source)
+        try:
+            outputs[submission] = grade_isolated(tests)
+        finally:
+            clean_up_submission()
+    return outputs
+
+# Unpacks the archive on stdin into a scratch directory and makes it the working directory
+def unpack_archive():
+    scratch = tempfile.mkdtemp(prefix="run-", dir=scratch_root)
+    with tarfile.open(fileobj=sys.stdin.buffer, mode="r|") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(scratch, filter="data")
+        else:
+            tar.extractall(scratch)
+    os.chdir(scratch)
+    return scratch
+
+def main():
+    become_undumpable()
+    scratch = unpack_archive() if archive_mode else None
+
+    # Test files are read once and shared by every submission in a batch
+    tests = load_tests()
+    if batch_mode:
+        print(json.dumps({"batch": grade_batch(tests)}))
+    else:
+        print(json.dumps(grade(tests)))
+
+    if scratch:
+        shutil.rmtree(scratch, ignore_errors=True)
 
 if __name__ == "__main__":
     main()
@@ -134,3 +134,52 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Grading backend: "docker" runs the code-runner images, "local" runs the runners as
+# rlimited subprocesses on this host (no isolation from the host; for machines without Docker)
+GRADING_BACKEND = "docker"
+CODE_RUNNER_GSON_JAR = os.path.join(BASE_DIR, "code_runner", "java", "gson.jar")  # Used by the local Java runner
+
+# Code runner containers, managed through the Docker Engine API on this socket
+DOCKER_SOCKET = os.environ.get("DOCKER_SOCKET", "/var/run/docker.sock")
+DOCKER_API_VERSION = "1.41"
+# Number of warm containers kept per language (0 starts a fresh container per submission)
+CODE_RUNNER_POOL_SIZE = {"python": 2, "java": 1}
+CODE_RUNNER_POOL_MAX_USES = 50  # Recycle a container after this many jobs
+CODE_RUNNER_MEMORY = "256m"
+CODE_RUNNER_CPUS = "0.5"
+CODE_RUNNER_PIDS_LIMIT = 64
+CODE_RUNNER_SCRATCH_SIZE = "64m"  # tmpfs the runner unpacks submissions into in archive mode
+CODE_RUNNER_TIMEOUT = 10  # Seconds allowed for a whole grading run (raised to fit longer per-test time limits)
+CODE_RUNNER_TEST_WORKERS = 0  # Test cases run in parallel per submission (0 = container CPU quota)
+CODE_RUNNER_OUTPUT_LIMIT = 65536  # Bytes of stdout/stderr kept per test case
+CODE_RUNNER_PROFILE = True  # Profile the first Python test that runs out of time and show students the result
+
+# Grading queue (run workers with `python manage.py grading_worker`)
+GRADING_POLL_INTERVAL = 0.5  # Seconds an idle worker waits before checking the queue again
+GRADING_JOB_STALE_SECONDS = 300  # Running jobs older than this are requeued when a worker starts
+GRADING_MAX_CONCURRENT_JOBS = 0  # Jobs graded at once across all workers (0 = fit CODE_RUNNER_CPUS/MEMORY to this host)
+GRADING_MEMORY_RESERVE = "1g"  # Memory kept back for the web app and database when sizing the above
+GRADING_BATCH_SIZE = 8  # Most queued jobs for the same question and language graded in one runner invocation (1 = no batching)
+GRADING_BATCH_WINDOW = 0.3  # Seconds a new job waits for others to arrive and join its batch
+GRADING_ARCHIVE_MODE = False  # Stream code and tests to the runner's stdin as a tar instead of writing a workspace
+GRADING_PREFLIGHT = True  # Record code that doesn't compile straight away instead of queueing it
+SAMPLE_RUN_TIMEOUT = 5  # Seconds allowed for a "Run Sample Tests" run (queued for the grading workers, ahead of submissions)
+GRADING_SAMPLE_SLOTS = 1  # Extra slots only sample runs may use (run a `grading_worker --sample-only` per slot)
+
+# Grading result cache (identical code + test suite + runner version reuses the stored result)
+GRADING_RESULT_CACHE = True
+CODE_RUNNER_VERSION = "4"  # Bump whenever the runner images change to stop reusing old results
+
+# Read-only test bundles, built once per CodeQuestion.test_version and shared by every grading run
+TEST_BUNDLE_ROOT = os.path.join(BASE_DIR, "test_bundles")
+
+# Grading workspaces (student code for one run), RAM-backed where /dev/shm exists
+GRADING_WORKSPACE_ROOT = "/dev/shm/cody_crush" if os.path.isdir("/dev/shm") else os.path.join(BASE_DIR, "submissions")
+KEEP_GRADING_WORKSPACES = False  # Keep workspaces after grading (for debugging the runners)
+GRADING_WORKSPACE_RETENTION = 3600  # Seconds before `manage.py sweep_workspaces` removes a leftover workspace
+
+# Teacher's student list
+STUDENT_LIST_PAGE_SIZE = 50
+STUDENT_LIST_CACHE_SECONDS = 0  # Serve the list from a snapshot refreshed on completion events (needs a cache shared by all processes)
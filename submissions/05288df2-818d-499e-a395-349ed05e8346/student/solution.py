@@ -1 +0,0 @@
-print(sum(map(int, [input(), input()])))
\ No newline at end of file
@@ -1,5 +0,0 @@
-# write below
-a = int(input())
-b = int(input())
-sum = a + b
-print(sum)
\ No newline at end of file
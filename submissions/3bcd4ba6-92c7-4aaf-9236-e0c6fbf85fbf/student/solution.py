@@ -1,2 +0,0 @@
-# write below
-print("whoa")
\ No newline at end of file
@@ -1,5 +0,0 @@
-# write below
-c = int(input())
-d = int(input())
-sum = c + d
-print(sum)
\ No newline at end of file
@@ -1 +0,0 @@
-Hello, world!
\ No newline at end of file
@@ -1,4 +0,0 @@
-# write below
-a = int(input())
-b = int(input())
-print(a+b)
\ No newline at end of file
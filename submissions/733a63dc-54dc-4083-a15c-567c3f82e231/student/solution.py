@@ -1 +0,0 @@
-print("Hello, world!")
\ No newline at end of file
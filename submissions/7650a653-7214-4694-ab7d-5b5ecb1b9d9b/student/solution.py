@@ -1,2 +0,0 @@
-# write below
-print("fail")
\ No newline at end of file
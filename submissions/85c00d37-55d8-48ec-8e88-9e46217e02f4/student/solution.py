@@ -1,2 +0,0 @@
-# write below
-print()
\ No newline at end of file
@@ -1,3 +0,0 @@
-# write below
-a = int(input())
-print(a)
\ No newline at end of file
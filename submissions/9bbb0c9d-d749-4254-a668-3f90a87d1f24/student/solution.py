@@ -1,2 +0,0 @@
-# write below
-print("a+b")
\ No newline at end of file
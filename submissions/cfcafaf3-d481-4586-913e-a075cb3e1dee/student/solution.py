@@ -1,2 +0,0 @@
-# write below
-print("test")
\ No newline at end of file
@@ -1,2 +0,0 @@
-while True:
-    pass
\ No newline at end of file